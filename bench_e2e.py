@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import zenscraper
+
+# name -> (mock_x.py arguments, scraper arguments)
+SCENARIOS = {
+    "baseline": ([], []),
+    "hydrate": (["--zero-rate", "0.3"], ["--hydrate-workers", "8", "--hydrate-rate", "50"]),
+    "threads": (["--zero-rate", "0.3"], ["--hydrate-workers", "8", "--hydrate-rate", "50", "--threads"]),
+    "tco": (["--tco-rate", "0.5"], []),
+    "rate-limited": (["--rate-limit-every", "15"], []),
+    "search": ([], ["--since-after", (datetime.now(timezone.utc) - timedelta(days=180)).strftime("%Y-%m-%d"),
+                    "--shard-days", "30", "--shard-workers", "3"]),
+}
+
+# Metrics that also keep every observation, for exact page-latency quantiles
+class SampledMetrics(zenscraper.Metrics):
+    def __init__(self):
+        super().__init__()
+        self.samples = {}
+
+    def observe(self, phase, seconds):
+        super().observe(phase, seconds)
+        self.samples.setdefault(phase, []).append(seconds)
+
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+# Current RSS of this process's children (the Playwright driver), from /proc on Linux
+def children_rss():
+    total = 0
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            if int(stat.read_text().rsplit(")", 1)[1].split()[1]) != os.getpid():
+                continue
+            for line in (stat.parent / "status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
+
+# Samples children_rss() in the background, keeping the peak; the driver exits with the run
+class ChildRssSampler(threading.Thread):
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, children_rss())
+
+# Runs one scrape against the mock in a fresh process, so RSS figures are per scenario
+def run_scenario(base_url, scraper_args, tweets, workdir, results):
+    zenscraper.X_BASE_URL = base_url
+    zenscraper.metrics = SampledMetrics()
+    zenscraper.log.setLevel("ERROR")
+    cookies = Path(workdir) / "cookies.json"
+    host = base_url.split("//", 1)[1].split(":", 1)[0]
+    cookies.write_text(json.dumps({"cookies": [
+        {"name": name, "value": "bench", "domain": host, "path": "/", "secure": False}
+        for name in ("auth_token", "ct0", "twid")
+    ]}), encoding="utf-8")
+    out_file = str(Path(workdir) / "bench.ndjson")
+    cfg = zenscraper.cfg_from_args(zenscraper.build_arg_parser().parse_args([
+        "--username", "bench", "--api", "--cookies", str(cookies), "--max", str(tweets),
+        "--scrolls", str(10**6), "--delay", "0", "--output", out_file,
+        "--tco-cache", "", "--detail-cache", "", "--state", str(Path(workdir) / "state.db"),
+    ] + scraper_args))
+    sink = zenscraper.open_sink(cfg, out_file)
+    sampler = ChildRssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    asyncio.run(zenscraper.scrape_user_tweets(cfg, sink=sink))
+    sink.close()
+    elapsed = time.perf_counter() - start
+    sampler.done.set()
+    pages = zenscraper.metrics.samples.get("page_request", [])
+    results.put({
+        "tweets": sink.count,
+        "seconds": elapsed,
+        "pages": len(pages),
+        "p50": quantile(pages, 0.5),
+        "p99": quantile(pages, 0.99),
+        "rss": zenscraper.peak_rss_bytes(),
+        "driver_rss": sampler.peak or None,
+        "events": dict(zenscraper.metrics.events),
+    })
+
+# Starts mock_x.py on a free port and returns (process, base URL)
+def start_mock(mock_args):
+    proc = subprocess.Popen(
+        [sys.executable, str(Path(__file__).with_name("mock_x.py")), "--port", "0"] + mock_args,
+        stdout=subprocess.PIPE, text=True,
+    )
+    for line in proc.stdout:
+        if line.startswith("http://"):
+            return proc, line.strip()
+    raise SystemExit("[!] mock_x.py exited before it was listening")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="End-to-end --api scrape benchmark against mock_x.py")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS),
+                    help=f"Comma-separated scenarios (default: {','.join(SCENARIOS)})")
+    ap.add_argument("--tweets", type=int, default=1000, help="Tweets collected per scenario (default: 1000)")
+    ap.add_argument("--latency", default="50", help="Mock latency per request in ms (default: 50)")
+    ap.add_argument("--page-size", default="20", help="Tweets per mock timeline page (default: 20)")
+    ap.add_argument("--recording", help="Serve this --record directory's pages instead of synthetic ones")
+    args = ap.parse_args()
+
+    common = ["--latency", args.latency, "--page-size", args.page_size]
+    if args.recording:
+        common += ["--recording", args.recording]
+    ctx = multiprocessing.get_context("spawn")
+
+    print(f"{'scenario':<14} {'tweets':>7} {'seconds':>8} {'tweets/s':>9} {'pages':>6} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'RSS MB':>7} {'driver MB':>10}")
+    for name in args.scenarios.split(","):
+        mock_args, scraper_args = SCENARIOS[name]
+        proc, base_url = start_mock(common + mock_args)
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                results = ctx.Queue()
+                child = ctx.Process(target=run_scenario, args=(base_url, scraper_args, args.tweets, workdir, results))
+                child.start()
+                child.join()
+                if results.empty():
+                    raise SystemExit(f"[!] Scenario {name} failed")
+                r = results.get()
+        finally:
+            proc.terminate()
+            proc.wait()
+        mb = lambda b: f"{b / 2**20:.0f}" if b else "-"
+        print(f"{name:<14} {r['tweets']:>7} {r['seconds']:>8.2f} {r['tweets'] / r['seconds']:>9.0f} "
+              f"{r['pages']:>6} {r['p50'] * 1000:>7.1f} {r['p99'] * 1000:>7.1f} "
+              f"{mb(r['rss']):>7} {mb(r['driver_rss']):>10}", flush=True)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import contextlib
+import copy
+import io
+import json
+import time
+import tracemalloc
+
+import zenscraper
+
+# Builds a synthetic UserTweets page so the benchmark runs without a recording
+def synthetic_page(first_id, count):
+    entries = []
+    for i in range(count):
+        tweet_id = str(first_id + i)
+        entries.append({
+            "entryId": f"tweet-{tweet_id}",
+            "content": {"itemContent": {"tweet_results": {"result": {
+                "rest_id": tweet_id,
+                "legacy": {
+                    "full_text": f"Synthetic   tweet {tweet_id}\nwith a link https://t.co/abc{i % 7}",
+                    "created_at": "Wed Oct 10 20:19:24 +0000 2018",
+                    "favorite_count": i + 1,
+                    "retweet_count": i % 5,
+                    "reply_count": i % 3,
+                    "entities": {
+                        "urls": [{"expanded_url": f"https://example.com/{tweet_id}"}],
+                        "media": [{"type": "photo",
+                                   "media_url_https": f"https://pbs.twimg.com/media/{tweet_id}.jpg"}],
+                    },
+                    "extended_entities": {"media": [{
+                        "type": "video",
+                        "video_info": {"variants": [
+                            {"bitrate": 256000, "url": f"https://video.twimg.com/{tweet_id}/256.mp4"},
+                            {"bitrate": 2176000, "url": f"https://video.twimg.com/{tweet_id}/2176.mp4"},
+                        ]},
+                    }]},
+                },
+            }}}},
+        })
+    entries.append({"entryId": f"cursor-bottom-{first_id}", "content": {"value": f"c{first_id}"}})
+    return {"endpoint": "UserTweets", "url": None, "key": None, "data": {"data": {"user": {"result": {
+        "timeline_v2": {"timeline": {"instructions": [{"type": "TimelineAddEntries", "entries": entries}]}}
+    }}}}}
+
+# Yields the tweet results of a timeline payload so their IDs can be rewritten
+def tweet_results(record):
+    data = record["data"].get("data", {})
+    if record["endpoint"] == "UserTweets":
+        result = data.get("user", {}).get("result", {})
+        timeline = (result.get("timeline_v2") or result.get("timeline") or {}).get("timeline", {})
+    else:
+        timeline = data.get("search_by_raw_query", {}).get("search_timeline", {}).get("timeline", {})
+    for instr in timeline.get("instructions", []):
+        for entry in instr.get("entries", []):
+            if entry.get("entryId", "").startswith("tweet-"):
+                yield entry, entry["content"]["itemContent"]["tweet_results"]["result"]
+
+# Cycles recorded pages with fresh tweet IDs until the corpus holds `size` tweets
+def build_corpus(records, size):
+    pages = [r for r in records if r["endpoint"] in zenscraper.TIMELINE_ENDPOINTS]
+    details = {r["key"]: r["data"] for r in records if r["endpoint"] == "TweetDetail"}
+    links = {r["key"]: r["data"] for r in records if r["endpoint"] == "tco"}
+    if not pages:
+        raise SystemExit("[!] Corpus has no UserTweets/SearchTimeline payloads")
+
+    corpus, corpus_details, next_id, total = [], {}, 10**18, 0
+    while total < size:
+        for page in pages:
+            page = copy.deepcopy(page)
+            for entry, result in tweet_results(page):
+                old_id = result.get("rest_id")
+                next_id += 1
+                result["rest_id"] = str(next_id)
+                entry["entryId"] = f"tweet-{next_id}"
+                if old_id in details:
+                    corpus_details[str(next_id)] = details[old_id]
+                total += 1
+            corpus.append(page)
+            if total >= size:
+                break
+    return corpus, corpus_details, links
+
+# Runs the corpus through a fresh collector and returns the records it produced
+async def run_once(cfg, corpus, details, links):
+    collector = zenscraper.TimelineCollector(
+        cfg, zenscraper.ReplayHydrator(details), zenscraper.ReplayTcoResolver(links)
+    )
+    for page in corpus:
+        await collector.process_timeline(page["data"], page["endpoint"])
+    await collector.drain()
+    return collector.finish()
+
+# Bytes held by `build()`'s result, traced from a clean start
+def traced_size(build):
+    tracemalloc.start()
+    held = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return size
+
+# Per-tweet footprint of the records as plain JSON-layout dicts versus Tweet objects,
+# both rebuilt from the same serialized output so neither shares strings with the run
+def footprint(records):
+    blob = json.dumps([t.to_dict() for t in records])
+    per = max(len(records), 1)
+    as_dicts = traced_size(lambda: json.loads(blob))
+    as_slots = traced_size(lambda: [zenscraper.Tweet.from_dict(d) for d in json.loads(blob)])
+    return as_dicts / per, as_slots / per
+
+# Times `repeat` runs, then traces one more for peak and retained bytes per record
+def measure(cfg, corpus, details, links, repeat):
+    best, produced = float("inf"), 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            produced = len(asyncio.run(run_once(cfg, corpus, details, links)))
+            best = min(best, time.perf_counter() - start)
+
+        tracemalloc.start()
+        records = asyncio.run(run_once(cfg, corpus, details, links))
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    as_dicts, as_slots = footprint(records)
+    del records
+    per = max(produced, 1)
+    return produced, produced / best if best else 0.0, peak / per, retained / per, as_dicts, as_slots
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark offline timeline normalization on recorded corpora")
+    ap.add_argument("corpora", nargs="*", help="Directories written by zenscraper.py --record")
+    ap.add_argument("--sizes", default="100,1000,10000",
+                    help="Comma-separated corpus sizes in tweets (default: 100,1000,10000)")
+    ap.add_argument("--repeat", type=int, default=3, help="Timed runs per size, best is kept (default: 3)")
+    args = ap.parse_args()
+
+    cfg = zenscraper.cfg_from_args(zenscraper.build_arg_parser().parse_args(
+        ["--username", "bench", "--max", str(10**9)]
+    ))
+    sources = [(path, zenscraper.load_recording(path)) for path in args.corpora]
+    if not sources:
+        sources = [("synthetic", [synthetic_page(1, 20)])]
+
+    print(f"{'corpus':<24} {'size':>8} {'records':>8} {'tweets/s':>10} {'peak B/tweet':>13} "
+          f"{'kept B/tweet':>13} {'dict B/tweet':>13} {'slots B/tweet':>14}")
+    for name, records in sources:
+        for size in (int(s) for s in args.sizes.split(",")):
+            corpus, details, links = build_corpus(records, size)
+            produced, rate, peak, retained, as_dicts, as_slots = measure(cfg, corpus, details, links, args.repeat)
+            print(f"{str(name)[-24:]:<24} {size:>8} {produced:>8} {rate:>10.0f} {peak:>13.0f} "
+                  f"{retained:>13.0f} {as_dicts:>13.0f} {as_slots:>14.0f}")
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import json
+import sys
 from pathlib import Path
 from playwright.sync_api import sync_playwright
 
@@ -43,4 +44,5 @@ def save_auth_cookies(output_path="x_cookies.json"):
         browser.close()
 
 if __name__ == "__main__":
-    save_auth_cookies()
\ No newline at end of file
+    # Optional output path, e.g. accounts/alt1.json to add an account to a --cookies pool
+    save_auth_cookies(sys.argv[1] if len(sys.argv) > 1 else "x_cookies.json")
\ No newline at end of file
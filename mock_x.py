@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+import argparse
+import copy
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import zenscraper
+from bench_parser import tweet_results
+
+TWITTER_EPOCH_MS = 1288834974657
+
+# Builds a tweet ID whose snowflake timestamp is `ts`, so date handling behaves as on X
+def snowflake_id(ts, seq=0):
+    return str(((int(ts * 1000) - TWITTER_EPOCH_MS) << 22) | (seq & 0x3FFFFF))
+
+# Stable numeric user ID for a screen name
+def user_id(screen_name):
+    return str(10**9 + zlib.crc32(screen_name.lower().encode()) % 10**9)
+
+# Parses a "YYYY-MM-DD" search operator value to a UTC timestamp
+def query_date(query, operator):
+    for part in query.split():
+        if part.startswith(operator + ":"):
+            return datetime.strptime(part.split(":", 1)[1], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    return None
+
+# One synthetic tweet result; the tweet's ID seeds its counts, links and media
+def tweet_result(tweet_id, screen_name, opts, in_reply_to=None, focal=False):
+    rng = random.Random(tweet_id)
+    zero = not focal and rng.random() < opts.zero_rate
+    legacy = {
+        "full_text": f"Mock tweet {tweet_id} by {screen_name}",
+        "created_at": zenscraper.format_created_at(zenscraper.snowflake_time(tweet_id).timestamp()),
+        "favorite_count": 0 if zero else rng.randint(1, 5000),
+        "retweet_count": 0 if zero else rng.randint(0, 500),
+        "reply_count": 0 if zero else rng.randint(0, 100),
+        "bookmark_count": 0 if zero else rng.randint(0, 50),
+        "in_reply_to_status_id_str": in_reply_to,
+        "entities": {"urls": []},
+    }
+    if rng.random() < opts.tco_rate:
+        legacy["full_text"] += f" https://t.co/m{tweet_id[-8:]}"  # No entity: the link gets resolved
+    else:
+        legacy["entities"]["urls"].append({"expanded_url": f"https://example.com/{tweet_id}"})
+    if rng.random() < opts.media_rate:
+        legacy["entities"]["media"] = [{"type": "photo",
+                                        "media_url_https": f"https://pbs.twimg.com/media/{tweet_id}.jpg"}]
+    return {
+        "__typename": "Tweet",
+        "rest_id": tweet_id,
+        "core": {"user_results": {"result": {"rest_id": user_id(screen_name),
+                                             "legacy": {"screen_name": screen_name}}}},
+        "legacy": legacy,
+    }
+
+def tweet_entry(result):
+    return {"entryId": f"tweet-{result['rest_id']}",
+            "content": {"itemContent": {"tweet_results": {"result": result}}}}
+
+def timeline_payload(endpoint, entries):
+    timeline = {"timeline": {"instructions": [{"type": "TimelineAddEntries", "entries": entries}]}}
+    if endpoint == "SearchTimeline":
+        return {"data": {"search_by_raw_query": {"search_timeline": timeline}}}
+    return {"data": {"user": {"result": {"timeline_v2": timeline}}}}
+
+# Serves recorded UserTweets/SearchTimeline pages in a loop. Later laps get fresh, older IDs
+# so the scraper sees them as new tweets.
+class RecordedPages:
+    def __init__(self, directory):
+        records = zenscraper.load_recording(directory)
+        self.pages = [r for r in records if r["endpoint"] in zenscraper.TIMELINE_ENDPOINTS]
+        self.details = {r["key"]: r["data"] for r in records if r["endpoint"] == "TweetDetail"}
+        if not self.pages:
+            raise SystemExit(f"[!] {directory} has no UserTweets/SearchTimeline payloads")
+
+    def page(self, endpoint, index, cursor):
+        record = copy.deepcopy(self.pages[index % len(self.pages)])
+        lap = index // len(self.pages)
+        entries = []
+        for entry, result in tweet_results(record):
+            if lap:
+                new_id = str(int(result["rest_id"]) - lap * 10**15)
+                result["rest_id"] = new_id
+                entry["entryId"] = f"tweet-{new_id}"
+            entries.append(entry)
+        return timeline_payload(endpoint, entries + [cursor])
+
+class MockX:
+    def __init__(self, opts):
+        self.opts = opts
+        self.recorded = RecordedPages(opts.recording) if opts.recording else None
+        self.started = time.time()
+        self.graphql_requests = 0
+        self.lock = threading.Lock()
+
+    # Sleeps for the configured latency with jitter
+    def wait(self):
+        if self.opts.latency:
+            jitter = 1 + random.uniform(-self.opts.jitter, self.opts.jitter)
+            time.sleep(max(0.0, self.opts.latency / 1000 * jitter))
+
+    # True when this GraphQL request should get an injected 429
+    def rate_limited(self):
+        with self.lock:
+            self.graphql_requests += 1
+            every = self.opts.rate_limit_every
+            return bool(every) and self.graphql_requests % every == 0
+
+    # Returns the (status, JSON body) of a GraphQL operation
+    def graphql(self, endpoint, variables):
+        if endpoint == "UserByScreenName":
+            name = variables.get("screen_name", "")
+            return 200, {"data": {"user": {"result": {"rest_id": user_id(name), "legacy": {
+                "screen_name": name, "name": name.title(), "description": "Mock profile",
+                "followers_count": 1000, "friends_count": 100, "created_at": "Wed Oct 10 20:19:24 +0000 2018",
+                "entities": {"description": {"urls": []}},
+            }}}}}
+        if endpoint in zenscraper.TIMELINE_ENDPOINTS:
+            return 200, self.timeline(endpoint, variables)
+        if endpoint == "TweetDetail":
+            return 200, self.conversation(variables.get("focalTweetId", ""))
+        return 404, {"errors": [{"message": f"Unknown operation {endpoint}"}]}
+
+    def timeline(self, endpoint, variables):
+        index = int(variables.get("cursor") or 0)
+        size = self.opts.page_size
+        if endpoint == "SearchTimeline":
+            query = variables.get("rawQuery", "")
+            name = next((p[5:] for p in query.split() if p.startswith("from:")), "mock")
+            newest = query_date(query, "until") or self.started
+            oldest = query_date(query, "since") or 0
+        else:
+            name = f"user{variables.get('userId', '')}"
+            newest, oldest = self.started, 0
+        cursor = {"entryId": f"cursor-bottom-{index + 1}", "content": {"value": str(index + 1)}}
+        if index >= self.opts.pages:
+            return timeline_payload(endpoint, [cursor])  # Empty page: end of the timeline
+        if self.recorded:
+            return self.recorded.page(endpoint, index, cursor)
+        entries = []
+        for i in range(index * size, (index + 1) * size):
+            ts = newest - (i + 1) * self.opts.spacing
+            if ts < oldest:
+                break
+            entries.append(tweet_entry(tweet_result(snowflake_id(ts, i), name, self.opts)))
+        return timeline_payload(endpoint, entries + [cursor])
+
+    # The focal tweet (with counts) and a few synthetic replies, or the recorded payload
+    def conversation(self, focal_id):
+        if self.recorded and focal_id in self.recorded.details:
+            return self.recorded.details[focal_id]
+        focal = tweet_result(focal_id, "mock", self.opts, focal=True)
+        ts = zenscraper.snowflake_time(focal_id).timestamp()
+        entries = [tweet_entry(focal)] + [
+            tweet_entry(tweet_result(snowflake_id(ts + 60 * (k + 1), k), f"replier{k}", self.opts,
+                                     in_reply_to=focal_id, focal=True))
+            for k in range(self.opts.replies)
+        ]
+        return {"data": {"threaded_conversation_with_injections_v2": {"instructions": [
+            {"type": "TimelineAddEntries", "entries": entries}]}}}
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        wbufsize = 64 * 1024  # Headers and body leave in one write, flushed per request
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, body, content_type="application/json", headers=()):
+            data = body if isinstance(body, bytes) else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("content-type", content_type)
+            self.send_header("content-length", str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parts = urllib.parse.urlsplit(self.path)
+            if parts.path.startswith("/t.co/"):
+                mock.wait()
+                code = parts.path.rsplit("/", 1)[-1]
+                return self.send(301, b"", "text/plain", [("location", f"/expanded/{code}")])
+            if parts.path.startswith("/expanded/"):
+                return self.send(200, b"ok", "text/plain")
+            if not parts.path.startswith("/i/api/graphql/"):
+                return self.send(404, {"errors": [{"message": "Not found"}]})
+            mock.wait()
+            if mock.rate_limited():
+                reset = str(int(time.time()) + mock.opts.rate_limit_reset)
+                return self.send(429, {"errors": [{"message": "Rate limit exceeded"}]}, headers=[
+                    ("x-rate-limit-remaining", "0"), ("x-rate-limit-reset", reset)])
+            query = urllib.parse.parse_qs(parts.query)
+            variables = json.loads(query.get("variables", ["{}"])[0])
+            status, body = mock.graphql(parts.path.rsplit("/", 1)[-1], variables)
+            self.send(status, body, headers=[("x-rate-limit-remaining", "10000"),
+                                             ("x-rate-limit-reset", str(int(time.time()) + 900))])
+
+    return Handler
+
+def build_parser():
+    ap = argparse.ArgumentParser(
+        description="Local stand-in for x.com's GraphQL API, for load-testing --api scrapes.\n"
+                    "Point the scraper at it with ZENSCRAPER_BASE_URL=http://HOST:PORT",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    ap.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    ap.add_argument("--port", type=int, default=8765, help="Port to listen on, 0 for any free one (default: 8765)")
+    ap.add_argument("--recording", help="Serve the timeline pages of a --record directory instead of synthetic ones")
+    ap.add_argument("--latency", type=float, default=50, help="Milliseconds added to each request (default: 50)")
+    ap.add_argument("--jitter", type=float, default=0.2, help="Latency varies by up to this fraction (default: 0.2)")
+    ap.add_argument("--page-size", type=int, default=20, help="Tweets per synthetic timeline page (default: 20)")
+    ap.add_argument("--pages", type=int, default=1000, help="Pages before a timeline runs out (default: 1000)")
+    ap.add_argument("--spacing", type=float, default=3600,
+                    help="Seconds between consecutive synthetic tweets (default: 3600)")
+    ap.add_argument("--zero-rate", type=float, default=0.0,
+                    help="Fraction of tweets with zero counts, which makes the scraper hydrate them (default: 0)")
+    ap.add_argument("--tco-rate", type=float, default=0.0,
+                    help="Fraction of tweets with a bare t.co link to resolve (default: 0)")
+    ap.add_argument("--media-rate", type=float, default=0.3, help="Fraction of tweets with a photo (default: 0.3)")
+    ap.add_argument("--replies", type=int, default=2, help="Replies in each TweetDetail conversation (default: 2)")
+    ap.add_argument("--rate-limit-every", type=int, default=0,
+                    help="Answer every Nth GraphQL request with HTTP 429, 0 for never (default: 0)")
+    ap.add_argument("--rate-limit-reset", type=int, default=1,
+                    help="Seconds until an injected rate limit resets (default: 1)")
+    return ap
+
+if __name__ == "__main__":
+    opts = build_parser().parse_args()
+    server = ThreadingHTTPServer((opts.host, opts.port), make_handler(MockX(opts)))
+    server.daemon_threads = True
+    host, port = server.server_address[:2]
+    print(f"http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
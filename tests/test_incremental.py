@@ -0,0 +1,59 @@
+import asyncio
+import json
+import sqlite3
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("playwright")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import mock_x
+import zenscraper
+
+# Starts mock_x.py in this process with a fixed clock, so tweet IDs repeat across runs
+@pytest.fixture
+def mock(monkeypatch):
+    opts = mock_x.build_parser().parse_args(["--latency", "0", "--page-size", "20"])
+    server_mock = mock_x.MockX(opts)
+    server_mock.started = time.time() - 3600
+    server = ThreadingHTTPServer(("127.0.0.1", 0), mock_x.make_handler(server_mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(zenscraper, "X_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    yield server_mock
+    server.shutdown()
+
+# Runs one --api --incremental scrape; returns the tweets it wrote
+def scrape(tmp_path, *args):
+    cookies = tmp_path / "cookies.json"
+    cookies.write_text(json.dumps({"cookies": [
+        {"name": name, "value": "test", "domain": "127.0.0.1", "path": "/", "secure": False}
+        for name in ("auth_token", "ct0", "twid")
+    ]}), encoding="utf-8")
+    out_file = str(tmp_path / "out.ndjson")
+    cfg = zenscraper.cfg_from_args(zenscraper.build_arg_parser().parse_args([
+        "--username", "mock", "--api", "--incremental", "--date-mode", "timeline", "--delay", "0",
+        "--cookies", str(cookies), "--output", out_file, "--state", str(tmp_path / "state.db"),
+        "--tco-cache", "", "--detail-cache", "",
+    ] + list(args)))
+    sink = zenscraper.open_sink(cfg, out_file)
+    before = sink.count
+    asyncio.run(zenscraper.scrape_user_tweets(cfg, sink=sink))
+    sink.close()
+    return sink.count - before
+
+def test_first_run_truncated_by_max_sets_the_mark(mock, tmp_path):
+    assert scrape(tmp_path, "--max", "30", "--scrolls", "5") == 30
+    newest_id, resume_id = sqlite3.connect(tmp_path / "state.db").execute(
+        "SELECT newest_id, resume_id FROM users").fetchone()
+    assert newest_id > 0 and resume_id is None
+
+    # Nothing new was posted: the next run stops at the mark on its first page
+    requests = mock.graphql_requests
+    assert scrape(tmp_path, "--max", "30", "--scrolls", "5") == 0
+    assert mock.graphql_requests - requests == 2  # UserByScreenName and one UserTweets page
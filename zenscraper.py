@@ -4,17 +4,322 @@ import asyncio
 import random
 import json
 import sys
+import time
+import urllib.error
 import urllib.parse
+import urllib.request
 from pathlib import Path
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import argparse
+import atexit
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import csv
+import enum
+import functools
+import hashlib
+import io
+import logging
+import os
 import re
-from playwright.async_api import async_playwright
+import socket
+import sqlite3
+import threading
+import zlib
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows; peak RSS is then left out of reports
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None  # Optional; .parquet output then falls back to CSV
 
 print("\nZenScraper created by 0Day3xpl0it\n")
 
 UA_PATH     = Path("user_agents.txt")
 COOKIE_PATH = Path("x_cookies.json")
+TCO_CACHE_PATH = Path("tco_cache.db")
+DETAIL_CACHE_PATH = Path("tweet_detail_cache.db")
+GRAPHQL_TEMPLATES_PATH = Path("graphql_templates.json")
+# Where --api requests to x.com and t.co actually go; point it at a stand-in server such
+# as mock_x.py for load tests
+X_BASE_URL = os.environ.get("ZENSCRAPER_BASE_URL", "https://x.com").rstrip("/")
+STATE_PATH  = Path("zenscraper_state.db")
+THREAD_DEPTH = 50  # Most reply ancestors followed up from one tweet with --threads
+REPLAY_BATCH = 16  # Recorded timeline files handed to a pool worker at once
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Seconds
+MEDIA_INDEX_NAME = "media_index.db"
+MEDIA_CHUNK = 256 * 1024  # Bytes read per download step, and per bandwidth-budget charge
+
+# Resource types and URL fragments aborted by each --block profile. The scraper only
+# reads GraphQL JSON, so media and telemetry are dead weight; scripts and XHR must load.
+TELEMETRY_URL_PARTS = (
+    "/jot/", "/1.1/jot", "client_event.json", "analytics.twitter.com", "analytics.x.com",
+    "ads-twitter.com", "ads-api.x.com", "google-analytics.com", "googletagmanager.com",
+    "doubleclick.net", "/i/adsct",
+)
+BLOCK_PROFILES = {
+    "none":   (frozenset(), ()),
+    "media":  (frozenset({"image", "media", "font"}), TELEMETRY_URL_PARTS),
+    "strict": (frozenset({"image", "media", "font", "stylesheet", "manifest", "texttrack", "beacon", "ping"}),
+               TELEMETRY_URL_PARTS),
+}
+# Typical transfer size per resource type, used to estimate bytes saved by aborted requests
+BLOCKED_BYTES_ESTIMATE = {
+    "image": 45_000, "media": 400_000, "font": 35_000, "stylesheet": 25_000,
+    "script": 60_000, "xhr": 2_000, "fetch": 2_000,
+}
+
+# Public bearer token of the X web app, sent with --api GraphQL requests unless a browser
+# run has saved the one the app currently uses to graphql_templates.json
+WEB_BEARER_TOKEN = ("AAAAAAAAAAAAAAAAAAAAANRILgAAAAAAnNwIzUejRCOuH5E6I8xnZz4puTs%3D"
+                    "1Zv7ttfk8LF81IUq16cHjhLTvJu4FA33AGWWjCpTnA")
+
+# Fallback query IDs and variables of the GraphQL operations the scraper calls directly.
+# X rotates query IDs; browser runs save the app's current ones to graphql_templates.json,
+# which take precedence.
+GRAPHQL_DEFAULTS = {
+    "UserByScreenName": ("1VOOyvKkiI3FMmkeDNxM9A", {
+        "screen_name": "", "withSafetyModeUserFields": True,
+    }),
+    "UserTweets": ("Y9WM4Id6UcGFE8Z-hbnixw", {
+        "userId": "", "count": 20, "includePromotedContent": True,
+        "withQuickPromoteEligibilityTweetFields": True, "withVoice": True, "withV2Timeline": True,
+    }),
+    "SearchTimeline": ("U3QTLwGF8sZCHDuWIMSAmg", {
+        "rawQuery": "", "count": 20, "querySource": "typed_query", "product": "Latest",
+    }),
+    "TweetDetail": ("Ez6kRPyXbqNlhBwcNMpU-Q", {
+        "focalTweetId": "", "with_rux_injections": False, "includePromotedContent": False,
+        "withCommunity": True, "withQuickPromoteEligibilityTweetFields": True,
+        "withBirdwatchNotes": False, "withVoice": True, "withV2Timeline": True,
+    }),
+}
+GRAPHQL_FEATURES = {
+    "rweb_tipjar_consumption_enabled": True,
+    "responsive_web_graphql_exclude_directive_enabled": True,
+    "verified_phone_label_enabled": False,
+    "creator_subscriptions_tweet_preview_api_enabled": True,
+    "responsive_web_graphql_timeline_navigation_enabled": True,
+    "responsive_web_graphql_skip_user_profile_image_extensions_enabled": False,
+    "communities_web_enable_tweet_community_results_fetch": True,
+    "c9s_tweet_anatomy_moderator_badge_enabled": True,
+    "articles_preview_enabled": True,
+    "tweetypie_unmention_optimization_enabled": True,
+    "responsive_web_edit_tweet_api_enabled": True,
+    "graphql_is_translatable_rweb_tweet_is_translatable_enabled": True,
+    "view_counts_everywhere_api_enabled": True,
+    "longform_notetweets_consumption_enabled": True,
+    "responsive_web_twitter_article_tweet_consumption_enabled": True,
+    "tweet_awards_web_tipping_enabled": False,
+    "creator_subscriptions_quote_tweet_preview_enabled": False,
+    "freedom_of_speech_not_reach_fetch_enabled": True,
+    "standardized_nudges_misinfo": True,
+    "tweet_with_visibility_results_prefer_gql_limited_actions_policy_enabled": True,
+    "rweb_video_timestamps_enabled": True,
+    "longform_notetweets_rich_text_read_enabled": True,
+    "longform_notetweets_inline_media_enabled": True,
+    "responsive_web_enhance_cards_enabled": False,
+    "hidden_profile_subscriptions_enabled": True,
+    "subscriptions_verification_info_is_identity_verified_enabled": True,
+    "subscriptions_verification_info_verified_since_enabled": True,
+    "highlights_tweets_tab_ui_enabled": True,
+}
+
+WHITESPACE_RE = re.compile(r"\s+")
+RT_PREFIX_RE  = re.compile(r"^RT @[^:]+:\s*")
+TCO_RE        = re.compile(r"https://t\.co/[a-zA-Z0-9]+")
+TIMELINE_ENDPOINTS = ("UserTweets", "SearchTimeline")
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+WEEKDAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = {m: i for i, m in enumerate(MONTH_NAMES, 1)}
+
+log = logging.getLogger("zenscraper")
+
+# One JSON object per log line; `extra={"fields": {...}}` adds structured fields
+class JsonLogFormatter(logging.Formatter):
+    PREFIX_RE = re.compile(r"^\[[!+*]\] ")
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "msg": self.PREFIX_RE.sub("", record.getMessage()),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False)
+
+# Sends the scraper's log to stdout as plain lines or JSON lines
+def setup_logging(fmt="text"):
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonLogFormatter() if fmt == "json" else logging.Formatter("%(message)s"))
+    log.handlers[:] = [handler]
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+# Peak resident memory of this process in bytes, or None where it cannot be read
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # Linux reports KiB
+
+# Process-wide run metrics: per-phase latency histograms, requests by endpoint and status,
+# bytes received and named event counters (cache hits, tweets, ...)
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.phases = {}  # phase -> {"buckets": [...], "sum", "count", "max"}
+        self.requests = collections.Counter()  # (endpoint, status) -> count
+        self.bytes = collections.Counter()  # endpoint -> bytes received
+        self.events = collections.Counter()
+
+    def observe(self, phase, seconds):
+        h = self.phases.get(phase)
+        if h is None:
+            h = self.phases[phase] = {"buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                                      "sum": 0.0, "count": 0, "max": 0.0}
+        h["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        h["sum"] += seconds
+        h["count"] += 1
+        h["max"] = max(h["max"], seconds)
+
+    # Times the enclosed block (awaits included) as one observation of `phase`
+    @contextlib.contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+
+    def request(self, endpoint, status, size=0):
+        self.requests[(endpoint, status)] += 1
+        self.bytes[endpoint] += size
+
+    def count(self, event, n=1):
+        self.events[event] += n
+
+    # Upper bucket bound below which `q` of the phase's observations fall
+    @staticmethod
+    def quantile(h, q):
+        rank, seen = q * h["count"], 0
+        for bound, n in zip(LATENCY_BUCKETS + (h["max"],), h["buckets"]):
+            seen += n
+            if seen >= rank:
+                return round(min(bound, h["max"]), 4)
+        return round(h["max"], 4)
+
+    def report(self):
+        elapsed = time.time() - self.started
+        e = self.events
+        ratio = lambda hits, total: round(hits / total, 4) if total else None
+        requests = {}
+        for (endpoint, status), n in sorted(self.requests.items(), key=str):
+            requests.setdefault(endpoint, {})[str(status)] = n
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "tweets": e["tweets"],
+            "tweets_per_s": round(e["tweets"] / elapsed, 2) if elapsed else None,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "phases": {
+                phase: {
+                    "count": h["count"], "sum_s": round(h["sum"], 4),
+                    "mean_s": round(h["sum"] / h["count"], 4), "max_s": round(h["max"], 4),
+                    "p50_s": self.quantile(h, 0.5), "p90_s": self.quantile(h, 0.9),
+                    "p99_s": self.quantile(h, 0.99),
+                }
+                for phase, h in sorted(self.phases.items())
+            },
+            "requests": requests,
+            "bytes_received": dict(self.bytes),
+            "hydration": {
+                "requests": e["hydrate_requests"], "shared": e["hydrate_shared"],
+                "failed": e["hydrate_failed"],
+                "shared_rate": ratio(e["hydrate_shared"], e["hydrate_requests"] + e["hydrate_shared"]),
+            },
+            "detail_cache": {
+                "hits": e["detail_cache_hit"], "misses": e["detail_cache_miss"],
+                "hit_rate": ratio(e["detail_cache_hit"], e["detail_cache_hit"] + e["detail_cache_miss"]),
+            },
+            "tco_cache": {
+                "hits": e["tco_cache_hit"], "misses": e["tco_cache_miss"],
+                "hit_rate": ratio(e["tco_cache_hit"], e["tco_cache_hit"] + e["tco_cache_miss"]),
+            },
+            "media": {
+                "downloaded": e["media_downloaded"], "reused": e["media_reused"],
+                "reuse_rate": ratio(e["media_reused"], e["media_downloaded"] + e["media_reused"]),
+            },
+            "events": dict(e),
+        }
+
+    def write_report(self, path):
+        Path(path).write_text(json.dumps(self.report(), indent=2), encoding="utf-8")
+        log.info(f"[+] Metrics report → {path}")
+
+    # Renders the metrics in the Prometheus text exposition format
+    def prometheus(self):
+        lines = ["# TYPE zenscraper_phase_seconds histogram"]
+        for phase, h in sorted(self.phases.items()):
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), h["buckets"]):
+                cumulative += n
+                lines.append(f'zenscraper_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {cumulative}')
+            lines.append(f'zenscraper_phase_seconds_sum{{phase="{phase}"}} {h["sum"]:.6f}')
+            lines.append(f'zenscraper_phase_seconds_count{{phase="{phase}"}} {h["count"]}')
+        lines.append("# TYPE zenscraper_requests_total counter")
+        for (endpoint, status), n in sorted(self.requests.items(), key=str):
+            lines.append(f'zenscraper_requests_total{{endpoint="{endpoint}",status="{status}"}} {n}')
+        lines.append("# TYPE zenscraper_received_bytes_total counter")
+        for endpoint, n in sorted(self.bytes.items()):
+            lines.append(f'zenscraper_received_bytes_total{{endpoint="{endpoint}"}} {n}')
+        lines.append("# TYPE zenscraper_events_total counter")
+        for event, n in sorted(self.events.items()):
+            lines.append(f'zenscraper_events_total{{event="{event}"}} {n}')
+        rss = peak_rss_bytes()
+        if rss is not None:
+            lines.append("# TYPE zenscraper_peak_rss_bytes gauge")
+            lines.append(f"zenscraper_peak_rss_bytes {rss}")
+        return "\n".join(lines) + "\n"
+
+    # Replaces the textfile atomically so a collector never reads half a file
+    def write_prometheus(self, path):
+        tmp = f"{path}.tmp"
+        Path(tmp).write_text(self.prometheus(), encoding="utf-8")
+        os.replace(tmp, path)
+
+    # Rewrites the Prometheus textfile every `interval` seconds until the returned event is set
+    def export_periodically(self, path, interval=15):
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                self.write_prometheus(path)
+
+        threading.Thread(target=loop, daemon=True).start()
+        return stop
+
+metrics = Metrics()
+
+# Starts the optional Prometheus textfile export; both outputs are written once more at exit
+def enable_metrics(report=None, prometheus=None, interval=15):
+    stop = metrics.export_periodically(prometheus, interval) if prometheus else None
+
+    def finish():
+        if stop:
+            stop.set()
+            metrics.write_prometheus(prometheus)
+        if report:
+            metrics.write_report(report)
+
+    atexit.register(finish)
 
 # Fetches a random user agent from a file for browser requests
 def get_random_user_agent(file_path="user_agents.txt"):
@@ -25,472 +330,2829 @@ def get_random_user_agent(file_path="user_agents.txt"):
         return ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
                 "AppleWebKit/537.36 Chrome/120.0.0.0 Safari/537.36")
 
-# Selects a random language code for browser requests
-def get_random_lang():
-    return random.choice(["en-US,en;q=0.9", "en-GB,en;q=0.8", "en;q=0.7"])
+# Selects a random language code for browser requests
+def get_random_lang():
+    return random.choice(["en-US,en;q=0.9", "en-GB,en;q=0.8", "en;q=0.7"])
+
+# Loads auth cookies once per process; batch runs share the parsed list
+@functools.lru_cache(maxsize=None)
+def load_cookies(path=COOKIE_PATH):
+    try:
+        with open(path) as fh:
+            cookie_data = json.load(fh)
+        return cookie_data if isinstance(cookie_data, list) else cookie_data.get("cookies", [])
+    except Exception as e:
+        log.warning(f"[!] Cookie error: {e}. Please update x_cookies.json with valid cookies.")
+        sys.exit(1)
+
+# Expands --cookies arguments into cookie files; a directory stands for every *.json in it
+def cookie_files(paths):
+    files = []
+    for path in paths:
+        path = Path(path)
+        files.extend(sorted(path.glob("*.json")) if path.is_dir() else [path])
+    return files
+
+# Counts requests aborted by a blocking profile, per resource type
+class BlockStats:
+    def __init__(self):
+        self.requests = collections.Counter()
+        self.bytes = collections.Counter()
+
+    # Aborted responses are never received, so their size is a per-type estimate
+    def add(self, resource_type):
+        self.requests[resource_type] += 1
+        self.bytes[resource_type] += BLOCKED_BYTES_ESTIMATE.get(resource_type, 5_000)
+
+    def report(self, label):
+        if not self.requests:
+            return
+        parts = ", ".join(f"{rtype} {count} (~{self.bytes[rtype] / 1e6:.1f} MB)"
+                          for rtype, count in self.requests.most_common())
+        log.info(f"[+] Blocked {sum(self.requests.values())} requests for {label}, "
+                 f"~{sum(self.bytes.values()) / 1e6:.1f} MB saved: {parts}")
+
+# Aborts non-essential requests in a context according to a BLOCK_PROFILES entry
+async def install_blocking(context, profile, stats):
+    resource_types, url_parts = BLOCK_PROFILES[profile]
+    if not resource_types and not url_parts:
+        return
+
+    async def handle_route(route):
+        request = route.request
+        if request.resource_type in resource_types or any(p in request.url for p in url_parts):
+            stats.add(request.resource_type)
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", handle_route)
+
+# Creates an authenticated browser context with a randomized fingerprint. A saved
+# storage_state file, when given and present, replaces the cookies from x_cookies.json.
+async def new_scrape_context(browser, block="none", block_stats=None, storage_state=None, cookies=None):
+    if isinstance(browser, ApiBrowser):
+        return await browser.new_context(cookies if cookies is not None else load_cookies())
+    saved = storage_state and Path(storage_state).exists()
+    context = await browser.new_context(
+        user_agent=get_random_user_agent(),
+        locale=get_random_lang(),
+        viewport={"width": 1280, "height": 800},
+        storage_state=str(storage_state) if saved else None
+    )
+    if not saved:
+        await context.add_cookies(cookies if cookies is not None else load_cookies())
+    await install_blocking(context, block, block_stats if block_stats is not None else BlockStats())
+    return context
+
+# Returns a cookie from x_cookies.json in the shape Playwright's storage_state expects
+def storage_cookie(cookie):
+    return {
+        "name": cookie["name"], "value": cookie["value"],
+        "domain": cookie.get("domain", ".x.com"), "path": cookie.get("path", "/"),
+        "expires": cookie.get("expires", -1), "httpOnly": cookie.get("httpOnly", False),
+        "secure": cookie.get("secure", True), "sameSite": cookie.get("sameSite", "Lax"),
+    }
+
+# Maps an x.com or t.co URL onto X_BASE_URL when a stand-in server is configured
+def routed_url(url):
+    if X_BASE_URL == "https://x.com":
+        return url
+    for host, prefix in (("https://x.com/", "/"), ("https://t.co/", "/t.co/")):
+        if url.startswith(host):
+            return X_BASE_URL + prefix + url[len(host):]
+    return url
+
+# Browserless stand-in for a logged-in browser context (--api): a Playwright
+# APIRequestContext holding an account's cookies. GraphQL requests get the web app's
+# bearer token, the account's ct0 as CSRF token and the client headers; other URLs
+# (t.co redirects) are requested without them.
+class ApiSession:
+    def __init__(self, request_context, cookies):
+        self.request_context = request_context
+        self.cookie_list = cookies
+        self.headers = api_headers(next((c["value"] for c in cookies if c["name"] == "ct0"), ""))
+
+    @classmethod
+    async def create(cls, playwright, cookies):
+        request_context = await playwright.request.new_context(
+            user_agent=get_random_user_agent(),
+            extra_http_headers={"accept-language": get_random_lang()},
+            storage_state={"cookies": [storage_cookie(c) for c in cookies], "origins": []},
+        )
+        return cls(request_context, cookies)
+
+    # Same shape as a browser context's request API
+    @property
+    def request(self):
+        return self
+
+    async def get(self, url, headers=None, **kwargs):
+        if url.startswith("https://x.com/i/api/"):
+            headers = {**self.headers, **(headers or {})}
+        return await self.request_context.get(routed_url(url), headers=headers, **kwargs)
+
+    async def cookies(self, url=None):
+        return self.cookie_list
+
+    async def close(self):
+        await self.request_context.dispose()
+
+# Headers the web app sends with GraphQL calls: the saved bearer token (or the public web
+# one) and the account's ct0 cookie as CSRF token
+def api_headers(ct0=""):
+    return {
+        "authorization": load_graphql_templates().get("authorization") or f"Bearer {WEB_BEARER_TOKEN}",
+        "x-csrf-token": ct0,
+        "x-twitter-auth-type": "OAuth2Session",
+        "x-twitter-active-user": "yes",
+        "x-twitter-client-language": "en",
+        "content-type": "application/json",
+        "referer": "https://x.com/",
+    }
+
+# Takes the browser's place with --api: hands out ApiSessions instead of browser contexts
+class ApiBrowser:
+    def __init__(self, playwright):
+        self.playwright = playwright
+
+    async def new_context(self, cookies):
+        return await ApiSession.create(self.playwright, cookies)
+
+    async def close(self):
+        pass
+
+# Starts Chromium, or with --api the browserless ApiBrowser
+async def launch_browser(p, cfg):
+    if cfg.api:
+        return ApiBrowser(p)
+    return await p.chromium.launch(headless=cfg.headless)
+
+# Returns the saved GraphQL templates: operation name -> captured URL, and the bearer
+# "authorization" header the web app sent
+@functools.lru_cache(maxsize=None)
+def load_graphql_templates(path=GRAPHQL_TEMPLATES_PATH):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+# Saves a GraphQL request the web app made, so --api runs use its current query ID and
+# features. The file is only rewritten when those (or the bearer token) change.
+def save_graphql_template(url, headers=None, path=GRAPHQL_TEMPLATES_PATH):
+    endpoint = graphql_operation(url)
+    templates = dict(load_graphql_templates(path))
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qs(parts.query, keep_blank_values=True)
+    variables = json.loads(query.get("variables", ["{}"])[0])
+    variables.pop("cursor", None)
+    query["variables"] = [json.dumps(variables, separators=(",", ":"))]
+    url = urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query, doseq=True)))
+    shape = lambda u: (urllib.parse.urlsplit(u).path, {k: v for k, v in urllib.parse.parse_qs(
+        urllib.parse.urlsplit(u).query).items() if k != "variables"})
+    authorization = (headers or {}).get("authorization")
+    if endpoint in templates and shape(templates[endpoint]) == shape(url) and (
+            not authorization or templates.get("authorization") == authorization):
+        return
+    templates[endpoint] = url
+    if authorization:
+        templates["authorization"] = authorization
+    tmp = Path(f"{path}.tmp")
+    tmp.write_text(json.dumps(templates, indent=2), encoding="utf-8")
+    tmp.replace(path)
+    load_graphql_templates.cache_clear()
+
+# Builds a GraphQL GET URL from the saved template of `endpoint`, or the built-in
+# defaults, with the given variables
+def graphql_url(endpoint, **variables):
+    saved = load_graphql_templates().get(endpoint)
+    if saved:
+        return set_graphql_variables(saved, **variables)
+    query_id, defaults = GRAPHQL_DEFAULTS[endpoint]
+    query = {
+        "variables": json.dumps({**defaults, **variables}, separators=(",", ":")),
+        "features": json.dumps(GRAPHQL_FEATURES, separators=(",", ":")),
+    }
+    return f"https://x.com/i/api/graphql/{query_id}/{endpoint}?{urllib.parse.urlencode(query)}"
+
+# Returns the GraphQL operation name of an API URL (".../graphql/<id>/UserTweets" -> "UserTweets")
+def graphql_operation(url):
+    return urllib.parse.urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1]
+
+# Returns which timeline GraphQL endpoint a response URL belongs to, if any
+def timeline_endpoint(url):
+    for endpoint in TIMELINE_ENDPOINTS:
+        if endpoint in url:
+            return endpoint
+    return None
+
+# Rewrites some of the variables of a captured GraphQL URL
+def set_graphql_variables(url, **changes):
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qs(parts.query, keep_blank_values=True)
+    variables = json.loads(query.get("variables", ["{}"])[0])
+    variables.update(changes)
+    query["variables"] = [json.dumps(variables, separators=(",", ":"))]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query, doseq=True)))
+
+# Rewrites a captured timeline URL to request the page after `cursor`
+def set_graphql_cursor(url, cursor):
+    return set_graphql_variables(url, cursor=cursor)
+
+# Returns the request headers worth replaying from a captured browser request
+def replay_headers(headers):
+    return {k: v for k, v in headers.items()
+            if not k.startswith(":") and k not in ("cookie", "content-length")}
+
+# Returns the creation time encoded in a tweet ID (snowflake)
+def snowflake_time(tweet_id):
+    return datetime.fromtimestamp(((int(tweet_id) >> 22) + 1288834974657) / 1000, tz=timezone.utc)
+
+# Builds the Latest-tab search URL for a user's tweets inside a date window
+def search_url(username, since=None, until=None):
+    q_parts = [f"from:{username}"]
+    if since:
+        q_parts.append(f"since:{since.strftime('%Y-%m-%d')}")
+    if until:
+        q_parts.append(f"until:{until.strftime('%Y-%m-%d')}")
+    q = urllib.parse.quote(" ".join(q_parts))
+    return f"https://x.com/search?q={q}&src=typed_query&f=live"
+
+# Splits [since, until) into day-aligned windows of at most `days` days, newest first
+def date_windows(since, until, days):
+    windows = []
+    end = until
+    while end > since:
+        start = max(since, end - timedelta(days=days))
+        windows.append((start, end))
+        end = start
+    return windows
+
+# Halves a window on a day boundary, newest half first; one-day windows stay whole
+def split_window(since, until):
+    half = (until - since).days // 2
+    if half < 1:
+        return [(since, until)]
+    mid = since + timedelta(days=half)
+    return [(mid, until), (since, mid)]
+
+# Returns a tweet result without its TweetWithVisibilityResults wrapper, if any
+def unwrap_tweet_result(result):
+    if result.get("__typename") == "TweetWithVisibilityResults":
+        return result.get("tweet", {})
+    return result
+
+# Yields (tweet_id, result) for every tweet in a TweetDetail payload: the focal tweet, its
+# ancestors, the replies of each conversation thread, and any quoted or retweeted tweets
+def conversation_tweets(data):
+    instrs = (
+        data.get("data", {})
+            .get("threaded_conversation_with_injections_v2", {})
+            .get("instructions", [])
+    )
+    results = []
+    for instr in instrs:
+        for entry in instr.get("entries", []):
+            content = entry.get("content", {})
+            item_contents = [content.get("itemContent", {})]
+            item_contents += [i.get("item", {}).get("itemContent", {}) for i in content.get("items", [])]
+            for item in item_contents:
+                result = item.get("tweet_results", {}).get("result")
+                if result:
+                    results.append(result)
+    while results:
+        result = unwrap_tweet_result(results.pop(0))
+        for nested in (result.get("quoted_status_result", {}).get("result"),
+                       result.get("legacy", {}).get("retweeted_status_result", {}).get("result")):
+            if nested:
+                results.append(nested)
+        if result.get("rest_id"):
+            yield result["rest_id"], result
+
+# Returns the author's screen name of a tweet result
+def tweet_author(result):
+    user = result.get("core", {}).get("user_results", {}).get("result", {})
+    return user.get("core", {}).get("screen_name") or user.get("legacy", {}).get("screen_name") or ""
+
+# Fetches the TweetDetail conversation payload of a tweet, or None when the request fails
+async def fetch_tweet_detail(tweet_id, page, recorder=None):
+    try:
+        url = graphql_url("TweetDetail", focalTweetId=tweet_id)
+        metrics.count("hydrate_requests")
+        with metrics.timer("hydrate"):
+            # A browser context's request API sends cookies but not the app's auth headers;
+            # an AccountPool swaps in the CSRF token of the account it picks
+            r = await page.request.get(url, headers=api_headers())
+            body = await r.body()
+        metrics.request("TweetDetail", r.status, len(body))
+        if r.status != 200:
+            metrics.count("hydrate_failed")
+            log.warning(f"[!] Hydration failed for tweet {tweet_id}: HTTP {r.status}")
+            return None
+        data = json.loads(body)
+        if recorder:
+            recorder.save("TweetDetail", data, url=url, key=tweet_id)
+        return data
+    except Exception as e:
+        metrics.count("hydrate_failed")
+        log.warning(f"[!] Hydration failed for tweet {tweet_id}: {str(e)}")
+        return None
+
+# Token bucket that spaces out request starts to `rate` per second
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Oversized requests may borrow against future tokens instead of waiting forever
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((min(amount, self.capacity) - self.tokens) / self.rate)
+
+# One logged-in account: its browser context and X's per-endpoint rate-limit window
+class Account:
+    def __init__(self, name, context, ct0):
+        self.name = name
+        self.context = context
+        self.ct0 = ct0  # CSRF token X expects in x-csrf-token for this account's cookies
+        self.remaining = {}  # endpoint -> requests left in the current window
+        self.reset = {}  # endpoint -> epoch seconds when the window resets
+        self.in_flight = 0
+
+    # Requests left for the endpoint; None while parked. Unknown or reset windows count as full.
+    def budget(self, endpoint, now):
+        if self.reset.get(endpoint, 0) <= now:
+            return float("inf")
+        remaining = self.remaining.get(endpoint, 1)
+        return remaining if remaining > 0 else None
+
+# Spreads GraphQL requests over logged-in accounts using x-rate-limit-remaining/-reset:
+# each request goes to the account with the most budget left for its endpoint, and
+# accounts that run out or get a 429 are parked until their window resets. Exposes
+# `request.get` so it can stand in for a page or context's request API.
+class AccountPool:
+    MAX_429_RETRIES = 3
+
+    def __init__(self):
+        self.accounts = []
+
+    async def add(self, name, context):
+        cookies = await context.cookies("https://x.com")
+        ct0 = next((c["value"] for c in cookies if c["name"] == "ct0"), None)
+        self.accounts.append(Account(name, context, ct0))
+
+    @property
+    def request(self):
+        return self
+
+    # Returns the unparked account with the most budget for the endpoint, or None
+    def pick(self, endpoint):
+        now = time.time()
+        ready = [(budget, -a.in_flight, i) for i, a in enumerate(self.accounts)
+                 if (budget := a.budget(endpoint, now)) is not None]
+        return self.accounts[max(ready)[2]] if ready else None
+
+    # Updates an account's window from a GraphQL response's headers
+    def observe(self, account, endpoint, status, headers):
+        remaining = headers.get("x-rate-limit-remaining")
+        reset = headers.get("x-rate-limit-reset")
+        if remaining is not None and reset is not None:
+            account.remaining[endpoint] = int(remaining)
+            account.reset[endpoint] = float(reset)
+        if status == 429:
+            account.remaining[endpoint] = 0
+            if account.reset.get(endpoint, 0) <= time.time():
+                account.reset[endpoint] = time.time() + 60  # No usable reset header
+            until = datetime.fromtimestamp(account.reset[endpoint]).strftime("%H:%M:%S")
+            metrics.count("rate_limited")
+            log.warning(f"[!] Account {account.name} rate limited on {endpoint}; parked until {until}",
+                        extra={"fields": {"account": account.name, "endpoint": endpoint,
+                                          "reset": account.reset[endpoint]}})
+
+    async def get(self, url, headers=None, **kwargs):
+        endpoint = graphql_operation(url)
+        limited = 0
+        while True:
+            account = self.pick(endpoint)
+            if account is None:
+                wake = min(a.reset.get(endpoint, 0) for a in self.accounts)
+                wait = max(1.0, wake - time.time())
+                log.info(f"[*] All accounts rate limited on {endpoint}; waiting {wait:.0f}s")
+                with metrics.timer("rate_limit_wait"):
+                    await asyncio.sleep(wait)
+                continue
+            if headers and "x-csrf-token" in headers:
+                headers = {**headers, "x-csrf-token": account.ct0 or ""}
+            if endpoint in account.remaining:
+                account.remaining[endpoint] -= 1  # Reserved now, corrected by the response
+            account.in_flight += 1
+            try:
+                r = await account.context.request.get(url, headers=headers, **kwargs)
+            finally:
+                account.in_flight -= 1
+            self.observe(account, endpoint, r.status, r.headers)
+            if r.status == 429 and limited < self.MAX_429_RETRIES:
+                limited += 1
+                continue
+            return r
+
+    async def close(self):
+        for account in self.accounts:
+            await account.context.close()
+
+# Runs one task per key and hands every caller a shielded view of it: repeated keys share
+# one request, and a cancelled caller does not cancel it for the others
+class SharedTasks:
+    def __init__(self, run, shared_metric=None):
+        self.run = run
+        self.shared_metric = shared_metric  # Counted each time a key is served from a running task
+        self.tasks = {}
+
+    def get(self, key):
+        task = self.tasks.get(key)
+        if task is None:
+            task = self.tasks[key] = asyncio.ensure_future(self.run(key))
+        elif self.shared_metric:
+            metrics.count(self.shared_metric)
+        return asyncio.shield(task)
+
+    # Stops tasks still in flight when the run ends
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
+
+# Runs TweetDetail hydrations on a bounded, rate-limited worker pool. With a DetailCache,
+# lookups are answered from earlier conversations before any request is made.
+class Hydrator:
+    # `session` is a page, browser context or AccountPool; hydrations use its request API
+    def __init__(self, session, workers=4, rate=2.0, recorder=None, cache=None):
+        self.session = session
+        self.recorder = recorder
+        self.cache = cache
+        self.limit = asyncio.Semaphore(workers)
+        self.bucket = TokenBucket(rate) if rate else None  # A rate of 0 means unlimited
+        self.pending = SharedTasks(self._run, "hydrate_shared")  # Each tweet is fetched once per run
+
+    # Returns an awaitable for the tweet's full result (None when it could not be fetched);
+    # repeated IDs share one request
+    def lookup(self, tweet_id):
+        return self.pending.get(tweet_id)
+
+    # Returns the tweet's hydrated legacy dict, or None when hydration failed
+    async def hydrate(self, tweet_id):
+        result = await self.lookup(tweet_id)
+        return result.get("legacy") if result else None
+
+    # Stops requests still in flight when the run ends
+    def cancel(self):
+        self.pending.cancel()
+
+    async def _run(self, tweet_id):
+        if self.cache:
+            result = self.cache.get(tweet_id)
+            metrics.count("detail_cache_hit" if result else "detail_cache_miss")
+            if result:
+                return result
+        async with self.limit:
+            if self.bucket:
+                await self.bucket.acquire()
+            data = await fetch_tweet_detail(tweet_id, self.session, self.recorder)
+        if data is None:
+            return None
+        if self.cache:
+            self.cache.put_conversation(data)
+        for rid, result in conversation_tweets(data):
+            if rid == tweet_id:
+                return result
+        metrics.count("hydrate_failed")
+        log.warning(f"[!] Hydration failed for tweet {tweet_id}: No tweet entry found")
+        return None
+
+# SQLite key/value table shared across runs and processes: rows expire `ttl(value)`
+# seconds after they were stored (checked on read), and the least recently used ones are
+# evicted once the table grows past max_entries. `columns` names the key, value and
+# stored-at columns.
+class CacheTable:
+    def __init__(self, path, table, columns, ttl, max_entries):
+        self.table = table
+        self.key, self.value, self.stored = columns
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.writes = 0
+        self.db = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"{self.key} TEXT PRIMARY KEY, {self.value}, {self.stored} REAL, used_at REAL)"
+        )
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS {table}_used_at ON {table}(used_at)")
+
+    # Returns (hit, value); expired rows are deleted and count as misses
+    def get(self, key):
+        row = self.db.execute(
+            f"SELECT {self.value}, {self.stored} FROM {self.table} WHERE {self.key} = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return False, None
+        value, stored_at = row
+        now = time.time()
+        if now - stored_at > self.ttl(value):
+            self.db.execute(f"DELETE FROM {self.table} WHERE {self.key} = ?", (key,))
+            return False, None
+        self.db.execute(f"UPDATE {self.table} SET used_at = ? WHERE {self.key} = ?", (now, key))
+        return True, value
+
+    # Stores (key, value) pairs, evicting every 500 writes
+    def put_many(self, rows):
+        now = time.time()
+        self.db.executemany(
+            f"INSERT OR REPLACE INTO {self.table} ({self.key}, {self.value}, {self.stored}, used_at) "
+            "VALUES (?, ?, ?, ?)",
+            [(key, value, now, now) for key, value in rows]
+        )
+        before, self.writes = self.writes, self.writes + len(rows)
+        if self.writes // 500 != before // 500:
+            self.evict()
+
+    # Drops the least recently used rows once the table grows past max_entries
+    def evict(self):
+        (count,) = self.db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            self.db.execute(
+                f"DELETE FROM {self.table} WHERE {self.key} IN "
+                f"(SELECT {self.key} FROM {self.table} ORDER BY used_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def close(self):
+        self.evict()
+        self.db.close()
+
+# SQLite-backed t.co resolution cache. get() returns (hit, expanded_url); a hit with None
+# means the link is known to fail, which is remembered for negative_ttl only.
+class TcoCache(CacheTable):
+    def __init__(self, path=TCO_CACHE_PATH, ttl=30 * 86400, negative_ttl=3600, max_entries=200000):
+        super().__init__(path, "tco", ("url", "expanded", "resolved_at"),
+                         lambda expanded: ttl if expanded else negative_ttl, max_entries)
+
+    def put(self, url, expanded):
+        self.put_many([(url, expanded)])
+
+# SQLite cache of TweetDetail tweet results keyed by tweet ID. Every tweet of a fetched
+# conversation is stored, so one request answers later lookups of its ancestors, siblings
+# and quoted tweets. Results are stored as compressed JSON.
+class DetailCache(CacheTable):
+    def __init__(self, path=DETAIL_CACHE_PATH, ttl=7 * 86400, max_entries=200000):
+        super().__init__(path, "details", ("id", "result", "fetched_at"), lambda _: ttl, max_entries)
+
+    # Returns the cached tweet result, or None when it is missing or expired
+    def get(self, tweet_id):
+        hit, blob = super().get(tweet_id)
+        return json.loads(zlib.decompress(blob)) if hit else None
+
+    # Stores every tweet of a TweetDetail payload
+    def put_conversation(self, data):
+        rows = {rid: result for rid, result in conversation_tweets(data)}
+        self.put_many([(rid, zlib.compress(json.dumps(result, separators=(",", ":")).encode()))
+                       for rid, result in rows.items()])
+
+# Resolves t.co links through the persistent cache; misses are fetched once per run
+class TcoResolver:
+    def __init__(self, request, cache=None, rate=10.0, recorder=None):
+        self.request = request
+        self.cache = cache
+        self.recorder = recorder
+        self.bucket = TokenBucket(rate)
+        self.pending = SharedTasks(self._run)
+
+    def resolve(self, tco_url):
+        return self.pending.get(tco_url)
+
+    # Stops requests still in flight when the run ends
+    def cancel(self):
+        self.pending.cancel()
+
+    async def _run(self, tco_url):
+        expanded_url = await self._lookup(tco_url)
+        if self.recorder:
+            self.recorder.save("tco", expanded_url, url=tco_url, key=tco_url)
+        return expanded_url
+
+    async def _lookup(self, tco_url):
+        if self.cache:
+            hit, expanded_url = self.cache.get(tco_url)
+            metrics.count("tco_cache_hit" if hit else "tco_cache_miss")
+            if hit:
+                return expanded_url
+        await self.bucket.acquire()
+        try:
+            with metrics.timer("tco"):
+                r = await self.request.get(tco_url, max_redirects=10)
+            metrics.request("t.co", r.status)
+            expanded_url = r.url
+        except Exception as e:
+            log.warning(f"[!] Failed to resolve t.co URL {tco_url}: {str(e)}")
+            expanded_url = None  # Cached briefly so dead links are not retried every run
+        if self.cache:
+            self.cache.put(tco_url, expanded_url)
+        return expanded_url
+
+# Downloads media into a content-addressed store (<dir>/<ab>/<sha256>.<ext>). A URL -> hash
+# index in the store lets later runs and retweets of the same media skip the download;
+# interrupted downloads stay in <dir>/.partial and resume with a Range request.
+class MediaDownloader:
+    def __init__(self, directory, workers=4, rate=0):
+        self.dir = Path(directory)
+        self.partial_dir = self.dir / ".partial"
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.limit = asyncio.Semaphore(workers)
+        self.bucket = TokenBucket(rate) if rate else None  # Bytes per second, shared by all workers
+        self.user_agent = get_random_user_agent(UA_PATH)
+        self.pending = SharedTasks(self._run)
+        self.closed = False
+        self.downloaded, self.reused, self.bytes = 0, 0, 0
+        self.db = sqlite3.connect(str(self.dir / MEDIA_INDEX_NAME), timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS media ("
+            "url TEXT PRIMARY KEY, sha256 TEXT, path TEXT, size INTEGER, fetched_at REAL)"
+        )
+
+    # Returns an awaitable for the media's local path (None on failure)
+    def fetch(self, url):
+        return self.pending.get(url)
+
+    async def _run(self, url):
+        row = self.db.execute("SELECT path FROM media WHERE url = ?", (url,)).fetchone()
+        if row and (self.dir / row[0]).exists():
+            self.reused += 1
+            metrics.count("media_reused")
+            return str(self.dir / row[0])
+        async with self.limit:
+            try:
+                with metrics.timer("media"):
+                    loop = asyncio.get_running_loop()
+                    part, size = await loop.run_in_executor(None, self._download, url, loop)
+                    digest = await loop.run_in_executor(None, self._hash, part)
+            except Exception as e:
+                metrics.count("media_failed")
+                log.warning(f"[!] Failed to download {url}: {str(e)}")
+                return None
+        rel = Path(digest[:2]) / (digest + Path(urllib.parse.urlsplit(url).path).suffix)
+        target = self.dir / rel
+        if target.exists():
+            part.unlink()  # Same content under another URL
+        else:
+            target.parent.mkdir(exist_ok=True)
+            part.replace(target)
+        self.db.execute(
+            "INSERT OR REPLACE INTO media (url, sha256, path, size, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (url, digest, rel.as_posix(), size, time.time())
+        )
+        self.downloaded += 1
+        metrics.count("media_downloaded")
+        metrics.request("media", 200, size)
+        return str(target)
+
+    # Streams a URL into its .part file, resuming from what an earlier attempt left.
+    # Runs in a worker thread; the bandwidth budget is charged on the event loop.
+    def _download(self, url, loop):
+        part = self.partial_dir / (hashlib.sha1(url.encode()).hexdigest() + ".part")
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {"User-Agent": self.user_agent}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        try:
+            resp = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=60)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                return part, offset  # The earlier attempt already got every byte
+            raise
+        with resp:
+            if offset and resp.status != 206:
+                offset = 0  # Range ignored: start over
+            with open(part, "ab" if offset else "wb") as fh:
+                size = offset
+                while True:
+                    if self.closed:
+                        raise RuntimeError("download stopped")
+                    chunk = resp.read(MEDIA_CHUNK)
+                    if not chunk:
+                        break
+                    if self.bucket:
+                        asyncio.run_coroutine_threadsafe(self.bucket.acquire(len(chunk)), loop).result()
+                    fh.write(chunk)
+                    size += len(chunk)
+                    self.bytes += len(chunk)
+        return part, size
+
+    @staticmethod
+    def _hash(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    # Stops downloads still in flight; their .part files are resumed next run
+    def cancel(self):
+        self.closed = True
+        self.pending.cancel()
+
+    def report(self):
+        log.info(f"[+] Media: {self.downloaded} downloaded ({self.bytes / 1e6:.1f} MB), "
+                 f"{self.reused} already stored")
+
+    def close(self):
+        self.db.close()
+
+# Saves raw GraphQL payloads to a directory so a run can be replayed offline
+class Recorder:
+    def __init__(self, directory):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.seq = len(list(self.dir.glob("*.json")))
+
+    def save(self, endpoint, data, url=None, key=None):
+        self.seq += 1
+        record = {"endpoint": endpoint, "url": url, "key": key, "data": data}
+        path = self.dir / f"{self.seq:06d}_{endpoint}.json"
+        path.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+
+# Loads recorded payloads in capture order
+def load_recording(directory):
+    return [json.loads(p.read_text(encoding="utf-8"))
+            for p in sorted(Path(directory).glob("*.json"))]
+
+# Answers hydrations from recorded TweetDetail payloads instead of the network
+class ReplayHydrator:
+    def __init__(self, details):
+        self.details = details  # tweet_id -> TweetDetail payload
+        self.results = None  # tweet_id -> result from any recorded conversation
+
+    async def lookup(self, tweet_id):
+        if self.results is None:
+            self.results = {}
+            for key, data in self.details.items():
+                for rid, result in conversation_tweets(data):
+                    if rid == key:
+                        self.results[rid] = result  # A tweet's own payload wins
+                    else:
+                        self.results.setdefault(rid, result)
+        return self.results.get(tweet_id)
+
+    async def hydrate(self, tweet_id):
+        result = await self.lookup(tweet_id)
+        return result.get("legacy") if result else None
+
+    def cancel(self):
+        pass
+
+# Answers t.co lookups from recorded resolutions instead of the network
+class ReplayTcoResolver:
+    def __init__(self, links):
+        self.links = links  # t.co URL -> expanded URL
+
+    async def resolve(self, tco_url):
+        return self.links.get(tco_url)
+
+    def cancel(self):
+        pass
+
+# Per-user high-water marks and known tweet IDs for incremental runs. `resume_id` is set
+# when a run stopped early with tweets left behind between it and the mark; the next run
+# keeps walking down to it.
+class StateStore:
+    def __init__(self, path=STATE_PATH):
+        self.db = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "username TEXT PRIMARY KEY, newest_id INTEGER, resume_id INTEGER, updated_at REAL)"
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(users)")}
+        if "resume_id" not in columns:  # State files from before resume bounds
+            self.db.execute("ALTER TABLE users ADD COLUMN resume_id INTEGER")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS known ("
+            "username TEXT, tweet_id TEXT, PRIMARY KEY (username, tweet_id)) WITHOUT ROWID"
+        )
+
+    def newest_id(self, username):
+        row = self.db.execute(
+            "SELECT newest_id FROM users WHERE username = ?", (username.lower(),)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def resume_id(self, username):
+        row = self.db.execute(
+            "SELECT resume_id FROM users WHERE username = ?", (username.lower(),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def known_ids(self, username):
+        rows = self.db.execute("SELECT tweet_id FROM known WHERE username = ?", (username.lower(),))
+        return {tweet_id for (tweet_id,) in rows}
+
+    # Adds the collected IDs, raises the user's high-water mark and sets (or clears) the
+    # resume bound in one transaction
+    def record(self, username, tweet_ids, newest_id, resume_id=None):
+        username = username.lower()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO known (username, tweet_id) VALUES (?, ?)",
+                [(username, tweet_id) for tweet_id in tweet_ids]
+            )
+            self.db.execute(
+                "INSERT INTO users (username, newest_id, resume_id, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET "
+                "newest_id = MAX(newest_id, excluded.newest_id), resume_id = excluded.resume_id, "
+                "updated_at = excluded.updated_at",
+                (username, newest_id, resume_id, time.time())
+            )
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self.db.close()
+
+# Shared username job queue for --worker processes, in a SQLite file. Claimed jobs are
+# leased: a worker renews its lease while the job runs, and a lease that expires (the
+# worker crashed or lost its machine) puts the job back in the queue. Failed jobs retry
+# with backoff until max_attempts, then stay as "dead" for inspection.
+class JobQueue:
+    RETRY_BACKOFF = 30  # Seconds before the first retry, doubled per attempt
+
+    def __init__(self, path):
+        # Rollback journal rather than WAL: WAL needs shared memory, so it breaks when
+        # workers on several machines share the file over a network filesystem
+        self.db = sqlite3.connect(str(path), timeout=60, isolation_level=None)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, username TEXT, type TEXT, status TEXT, "
+            "attempts INTEGER DEFAULT 0, max_attempts INTEGER, available_at REAL, "
+            "lease_until REAL, worker TEXT, enqueued_at REAL, started_at REAL, "
+            "finished_at REAL, duration REAL, items INTEGER, error TEXT, "
+            "UNIQUE (username, type))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, available_at)")
+
+    # Queues usernames; finished or dead jobs for the same user and type are queued again.
+    # Returns how many jobs were added or re-queued.
+    def enqueue(self, usernames, job_type, max_attempts=3):
+        now = time.time()
+        with self.transaction():
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT INTO jobs (username, type, status, max_attempts, available_at, enqueued_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?) "
+                "ON CONFLICT(username, type) DO UPDATE SET status = 'queued', attempts = 0, "
+                "max_attempts = excluded.max_attempts, available_at = excluded.available_at, "
+                "enqueued_at = excluded.enqueued_at, error = NULL "
+                "WHERE status IN ('done', 'dead')",
+                [(name, job_type, max_attempts, now, now) for name in usernames]
+            )
+            return self.db.total_changes - before
+
+    # Leases the next ready job to `worker` for `lease` seconds; returns a dict or None
+    def claim(self, worker, lease):
+        now = time.time()
+        with self.transaction():
+            self.expire_leases(now)
+            row = self.db.execute(
+                "SELECT id, username, type, attempts FROM jobs "
+                "WHERE status = 'queued' AND available_at <= ? ORDER BY available_at, id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, started_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (worker, now + lease, now, row[0])
+            )
+        return {"id": row[0], "username": row[1], "type": row[2], "attempt": row[3] + 1}
+
+    # Extends a running job's lease; False when the worker no longer holds it
+    def renew(self, job_id, worker, lease):
+        cur = self.db.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+            (time.time() + lease, job_id, worker)
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job_id, worker, items):
+        now = time.time()
+        self.db.execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, duration = ? - started_at, "
+            "items = ?, error = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+            (now, now, items, job_id, worker)
+        )
+
+    # Re-queues a failed job with backoff, or dead-letters it once out of attempts
+    def fail(self, job_id, worker, error):
+        now = time.time()
+        self.db.execute(
+            "UPDATE jobs SET finished_at = ?, duration = ? - started_at, error = ?, "
+            "status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END, "
+            "available_at = ? + ? * (1 << (attempts - 1)) "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (now, now, str(error)[:500], now, self.RETRY_BACKOFF, job_id, worker)
+        )
+
+    # Puts jobs whose worker stopped renewing back in the queue (or dead-letters them)
+    def expire_leases(self, now):
+        self.db.execute(
+            "UPDATE jobs SET error = 'lease expired (worker ' || worker || ' stopped)', "
+            "status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END, "
+            "available_at = ? WHERE status = 'leased' AND lease_until < ?",
+            (now, now)
+        )
+
+    # Job counts by status and the duration profile of finished jobs, for capacity planning
+    def stats(self):
+        counts = dict(self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        durations = [d for (d,) in self.db.execute(
+            "SELECT duration FROM jobs WHERE status = 'done' ORDER BY duration")]
+        (items,) = self.db.execute(
+            "SELECT COALESCE(SUM(items), 0) FROM jobs WHERE status = 'done'").fetchone()
+        pick = lambda q: round(durations[min(len(durations) - 1, int(q * len(durations)))], 3)
+        return {
+            "jobs": counts,
+            "done_items": items,
+            "duration_s": {
+                "mean": round(sum(durations) / len(durations), 3), "p50": pick(0.5),
+                "p95": pick(0.95), "max": round(durations[-1], 3),
+            } if durations else None,
+            "dead": [dict(zip(("username", "type", "attempts", "error"), row)) for row in self.db.execute(
+                "SELECT username, type, attempts, error FROM jobs WHERE status = 'dead' ORDER BY id")],
+        }
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self.db.close()
+
+# Parses X's created_at ("Wed Oct 10 20:19:24 +0000 2018") to a UTC timestamp, or None
+def parse_created_at(value):
+    try:
+        _, month, day, clock, offset, year = value.split()
+        hour, minute, second = clock.split(":")
+        ts = datetime(int(year), MONTHS[month], int(day), int(hour), int(minute), int(second),
+                      tzinfo=timezone.utc).timestamp()
+        if offset != "+0000":
+            sign = -1 if offset[0] == "-" else 1
+            ts -= sign * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+        return ts
+    except (AttributeError, KeyError, ValueError):
+        return None
+
+# Formats a UTC timestamp the way X writes created_at
+def format_created_at(ts):
+    if ts is None:
+        return "unknown"
+    d = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return (f"{WEEKDAY_NAMES[d.weekday()]} {MONTH_NAMES[d.month - 1]} {d.day:02d} "
+            f"{d.hour:02d}:{d.minute:02d}:{d.second:02d} +0000 {d.year}")
+
+class MediaType(enum.Enum):
+    IMAGE = "image"
+    VIDEO = "video"
+
+class Media:
+    __slots__ = ("type", "url", "path")
+
+    def __init__(self, type, url, path=None):
+        self.type = type
+        self.url = url
+        self.path = path  # Local file once --download-media has stored it
+
+    def to_dict(self):
+        if self.path:
+            return {"type": self.type.value, "url": self.url, "path": self.path}
+        return {"type": self.type.value, "url": self.url}
+
+# One collected tweet. Kept small because whole runs are held in memory: created_at is a
+# timestamp, URLs are derived from the interned username, and lists are tuples.
+class Tweet:
+    __slots__ = ("id", "username", "text", "retweet_full_text", "created", "likes", "retweets",
+                 "replies", "bookmarks", "media", "expanded_urls", "parent", "thread")
+
+    def __init__(self, id, username, text=None, retweet_full_text=None, created=None, likes=0,
+                 retweets=0, replies=0, bookmarks=0, media=(), expanded_urls=(), parent=None,
+                 thread=None):
+        self.id = id
+        self.username = sys.intern(username)
+        self.text = text
+        self.retweet_full_text = retweet_full_text
+        self.created = created
+        self.likes = likes
+        self.retweets = retweets
+        self.replies = replies
+        self.bookmarks = bookmarks
+        self.media = media
+        self.expanded_urls = expanded_urls
+        self.parent = parent
+        self.thread = thread  # Reply ancestors, root first, with --threads
+
+    @property
+    def created_at(self):
+        return format_created_at(self.created)
+
+    @property
+    def url(self):
+        return f"https://x.com/{self.username}/status/{self.id}"
+
+    @property
+    def parent_url(self):
+        return f"https://x.com/{self.username}/status/{self.parent}" if self.parent else None
+
+    # Serializes to the JSON output layout; "thread" is only present with --threads
+    def to_dict(self):
+        d = {
+            "id": self.id,
+            "text": self.text,
+            "retweet_full_text": self.retweet_full_text,
+            "created_at": self.created_at,
+            "likes": self.likes,
+            "retweets": self.retweets,
+            "replies": self.replies,
+            "bookmarks": self.bookmarks,
+            "media": [m.to_dict() for m in self.media],
+            "expanded_urls": list(self.expanded_urls),
+            "parent": self.parent,
+            "url": self.url,
+            "parent_url": self.parent_url,
+        }
+        if self.thread is not None:
+            d["thread"] = [t.to_dict() for t in self.thread]
+        return d
+
+    # Rebuilds a tweet from its JSON output layout (previous runs, NDJSON spools)
+    @classmethod
+    def from_dict(cls, d):
+        url = d.get("url") or ""
+        username = url.split("/")[3] if url.count("/") >= 5 else ""
+        return cls(
+            d["id"], username, d.get("text"), d.get("retweet_full_text"),
+            parse_created_at(d.get("created_at")), d.get("likes", 0), d.get("retweets", 0),
+            d.get("replies", 0), d.get("bookmarks", 0),
+            tuple(Media(MediaType(m["type"]), m["url"], m.get("path")) for m in d.get("media") or ()),
+            tuple(d.get("expanded_urls") or ()), d.get("parent"),
+            tuple(cls.from_dict(a) for a in d["thread"]) if d.get("thread") is not None else None,
+        )
+
+# Sorts tweets by created_at, newest first; undated tweets go last
+def sort_tweets(tweets):
+    tweets.sort(key=lambda t: t.created or 0, reverse=True)
+    return tweets
+
+# Appends tweets to an output file as soon as they are normalized, flushing in batches
+class StreamSink:
+    def __init__(self, path, fmt="ndjson", append=False, batch_size=50):
+        self.path = path
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.buffer = []
+        self.count = 0
+        self.fh = open(path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, tweet):
+        if self.fmt == "text":
+            self.buffer.append(format_tweets_as_text([tweet]))
+        else:
+            self.buffer.append(json.dumps(tweet.to_dict(), ensure_ascii=False))
+        self.count += 1
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.fh.write("\n".join(self.buffer) + "\n")
+            self.fh.flush()
+            self.buffer.clear()
+
+    def close(self):
+        if not self.fh.closed:
+            self.flush()
+            self.fh.close()
+
+# Host of a URL without a leading "www.", for grouping links by site
+def url_domain(url):
+    host = urllib.parse.urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+# Returns the database path of a "sqlite:///path.db" output, or None for file outputs
+def sqlite_output_path(out_file):
+    if out_file.lower().startswith("sqlite:///"):
+        return out_file[len("sqlite:///"):]
+    return None
+
+# Archive-scale output in one SQLite database shared by any number of runs and users:
+# tweets, media, expanded URLs and profiles in normalized tables. Tweets are upserted by ID
+# in batched transactions, so re-scraping refreshes engagement counts; tweets_fts is an
+# FTS5 index over the text when SQLite has FTS5.
+class SqliteSink:
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS tweets ("
+        "id INTEGER PRIMARY KEY, username TEXT NOT NULL COLLATE NOCASE, text TEXT, retweet_full_text TEXT, "
+        "created_at REAL, likes INTEGER, retweets INTEGER, replies INTEGER, bookmarks INTEGER, "
+        "parent INTEGER, updated_at REAL)",
+        "CREATE INDEX IF NOT EXISTS tweets_user_created ON tweets(username, created_at)",
+        "CREATE INDEX IF NOT EXISTS tweets_created ON tweets(created_at)",
+        "CREATE INDEX IF NOT EXISTS tweets_parent ON tweets(parent)",
+        "CREATE TABLE IF NOT EXISTS media ("
+        "tweet_id INTEGER NOT NULL, position INTEGER NOT NULL, type TEXT, url TEXT, path TEXT, "
+        "PRIMARY KEY (tweet_id, position))",
+        "CREATE TABLE IF NOT EXISTS urls ("
+        "tweet_id INTEGER NOT NULL, position INTEGER NOT NULL, url TEXT, domain TEXT, "
+        "PRIMARY KEY (tweet_id, position))",
+        "CREATE INDEX IF NOT EXISTS urls_domain ON urls(domain)",
+        "CREATE TABLE IF NOT EXISTS profiles ("
+        "username TEXT PRIMARY KEY COLLATE NOCASE, name TEXT, description TEXT, location TEXT, "
+        "followers INTEGER, following INTEGER, created_at REAL, profile TEXT, updated_at REAL)",
+    )
+    FTS_SCHEMA = (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tweets_fts USING fts5("
+        "text, retweet_full_text, content='tweets', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS tweets_fts_insert AFTER INSERT ON tweets BEGIN "
+        "INSERT INTO tweets_fts(rowid, text, retweet_full_text) "
+        "VALUES (new.id, new.text, new.retweet_full_text); END",
+        "CREATE TRIGGER IF NOT EXISTS tweets_fts_delete AFTER DELETE ON tweets BEGIN "
+        "INSERT INTO tweets_fts(tweets_fts, rowid, text, retweet_full_text) "
+        "VALUES ('delete', old.id, old.text, old.retweet_full_text); END",
+        "CREATE TRIGGER IF NOT EXISTS tweets_fts_update AFTER UPDATE OF text, retweet_full_text ON tweets BEGIN "
+        "INSERT INTO tweets_fts(tweets_fts, rowid, text, retweet_full_text) "
+        "VALUES ('delete', old.id, old.text, old.retweet_full_text); "
+        "INSERT INTO tweets_fts(rowid, text, retweet_full_text) "
+        "VALUES (new.id, new.text, new.retweet_full_text); END",
+    )
+
+    def __init__(self, out_file, batch_size=500):
+        self.path = out_file
+        self.batch_size = batch_size
+        self.buffer = []
+        self.count = 0
+        self.db = sqlite3.connect(sqlite_output_path(out_file), timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.transaction():
+            for statement in self.SCHEMA:
+                self.db.execute(statement)
+            try:
+                for statement in self.FTS_SCHEMA:
+                    self.db.execute(statement)
+            except sqlite3.OperationalError as e:
+                log.warning(f"[!] No full-text index in {out_file}: {e}")
+
+    def write(self, tweet):
+        self.buffer.append(tweet)
+        # --threads ancestors are tweets too; the reply links to them through `parent`
+        self.buffer.extend(tweet.thread or ())
+        self.count += 1
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        now = time.time()
+        tweets = list({int(t.id): t for t in self.buffer}.values())  # Last copy of an ID wins
+        ids = [(int(t.id),) for t in tweets]
+        with self.transaction():
+            self.db.executemany(
+                "INSERT INTO tweets (id, username, text, retweet_full_text, created_at, likes, retweets, "
+                "replies, bookmarks, parent, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET likes = excluded.likes, retweets = excluded.retweets, "
+                "replies = excluded.replies, bookmarks = excluded.bookmarks, "
+                "created_at = COALESCE(excluded.created_at, created_at), updated_at = excluded.updated_at",
+                [(int(t.id), t.username, t.text, t.retweet_full_text, t.created, t.likes, t.retweets,
+                  t.replies, t.bookmarks, int(t.parent) if t.parent else None, now) for t in tweets]
+            )
+            # Text is only rewritten when it changed, so count refreshes leave the FTS index alone
+            self.db.executemany(
+                "UPDATE tweets SET text = ?, retweet_full_text = ? WHERE id = ? "
+                "AND (text IS NOT ? OR retweet_full_text IS NOT ?)",
+                [(t.text, t.retweet_full_text, int(t.id), t.text, t.retweet_full_text) for t in tweets]
+            )
+            self.db.executemany("DELETE FROM media WHERE tweet_id = ?", ids)
+            self.db.executemany("DELETE FROM urls WHERE tweet_id = ?", ids)
+            self.db.executemany(
+                "INSERT INTO media (tweet_id, position, type, url, path) VALUES (?, ?, ?, ?, ?)",
+                [(int(t.id), i, m.type.value, m.url, m.path) for t in tweets for i, m in enumerate(t.media)]
+            )
+            self.db.executemany(
+                "INSERT INTO urls (tweet_id, position, url, domain) VALUES (?, ?, ?, ?)",
+                [(int(t.id), i, u, url_domain(u)) for t in tweets for i, u in enumerate(t.expanded_urls)]
+            )
+        self.buffer.clear()
+
+    # Upserts a profile (the legacy dict of UserByScreenName) under its screen name
+    def write_profile(self, username, profile):
+        with self.transaction():
+            self.db.execute(
+                "INSERT INTO profiles (username, name, description, location, followers, following, "
+                "created_at, profile, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET name = excluded.name, "
+                "description = excluded.description, location = excluded.location, "
+                "followers = excluded.followers, following = excluded.following, "
+                "created_at = excluded.created_at, profile = excluded.profile, updated_at = excluded.updated_at",
+                (profile.get("screen_name") or username, profile.get("name"), profile.get("description"),
+                 profile.get("location"), profile.get("followers_count"), profile.get("friends_count"),
+                 parse_created_at(profile.get("created_at")), json.dumps(profile, ensure_ascii=False), time.time())
+            )
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+# Writes tweets as Parquet for analytics, one row group per `row_group_size` tweets while
+# the scrape runs. created_at is a UTC timestamp column; media and expanded URLs are list
+# columns.
+class ParquetSink:
+    def __init__(self, path, row_group_size=10000):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.buffer = []
+        self.count = 0
+        self.schema = pyarrow.schema([
+            ("id", pyarrow.int64()),
+            ("username", pyarrow.string()),
+            ("text", pyarrow.string()),
+            ("retweet_full_text", pyarrow.string()),
+            ("created_at", pyarrow.timestamp("s", tz="UTC")),
+            ("likes", pyarrow.int64()),
+            ("retweets", pyarrow.int64()),
+            ("replies", pyarrow.int64()),
+            ("bookmarks", pyarrow.int64()),
+            ("parent", pyarrow.int64()),
+            ("media", pyarrow.list_(pyarrow.struct([
+                ("type", pyarrow.string()), ("url", pyarrow.string()), ("path", pyarrow.string())]))),
+            ("expanded_urls", pyarrow.list_(pyarrow.string())),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, tweet):
+        self.buffer.append(tweet)
+        self.count += 1
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        tweets = self.buffer
+        columns = {
+            "id": [int(t.id) for t in tweets],
+            "username": [t.username for t in tweets],
+            "text": [t.text for t in tweets],
+            "retweet_full_text": [t.retweet_full_text for t in tweets],
+            "created_at": [int(t.created) if t.created is not None else None for t in tweets],
+            "likes": [t.likes for t in tweets],
+            "retweets": [t.retweets for t in tweets],
+            "replies": [t.replies for t in tweets],
+            "bookmarks": [t.bookmarks for t in tweets],
+            "parent": [int(t.parent) if t.parent else None for t in tweets],
+            "media": [[{"type": m.type.value, "url": m.url, "path": m.path} for m in t.media] for t in tweets],
+            "expanded_urls": [list(t.expanded_urls) for t in tweets],
+        }
+        self.writer.write_table(pyarrow.Table.from_pydict(columns, schema=self.schema))
+        self.buffer = []
+
+    def close(self):
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+            self.writer = None
+
+# Flat CSV export: <stem>.csv holds one row per tweet with created_at in ISO 8601 UTC,
+# <stem>_media.csv and <stem>_urls.csv hold media and expanded URLs keyed by tweet_id.
+# Files are flushed every `row_group_size` tweets while the scrape runs.
+class CsvSink:
+    COLUMNS = ("id", "username", "text", "retweet_full_text", "created_at", "likes", "retweets",
+               "replies", "bookmarks", "parent")
+
+    def __init__(self, path, row_group_size=10000, append=False):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.count = 0
+        stem = Path(path).with_suffix("")
+        self.files, self.writers = [], []
+        for file_path, header in ((path, self.COLUMNS),
+                                  (f"{stem}_media.csv", ("tweet_id", "position", "type", "url", "path")),
+                                  (f"{stem}_urls.csv", ("tweet_id", "position", "url"))):
+            exists = append and Path(file_path).exists() and Path(file_path).stat().st_size > 0
+            fh = open(file_path, "a" if append else "w", encoding="utf-8", newline="")
+            writer = csv.writer(fh)
+            if not exists:
+                writer.writerow(header)
+            self.files.append(fh)
+            self.writers.append(writer)
+
+    def write(self, t):
+        tweets, media, urls = self.writers
+        created = (datetime.fromtimestamp(t.created, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                   if t.created is not None else "")
+        tweets.writerow((t.id, t.username, t.text, t.retweet_full_text, created, t.likes, t.retweets,
+                         t.replies, t.bookmarks, t.parent or ""))
+        media.writerows((t.id, i, m.type.value, m.url, m.path or "") for i, m in enumerate(t.media))
+        urls.writerows((t.id, i, u) for i, u in enumerate(t.expanded_urls))
+        self.count += 1
+        if self.count % self.row_group_size == 0:
+            self.flush()
+
+    def flush(self):
+        for fh in self.files:
+            fh.flush()
+
+    def close(self):
+        for fh in self.files:
+            if not fh.closed:
+                fh.close()
+
+# Reads tweets back from an NDJSON file, skipping a torn last line after a crash
+def read_ndjson(path):
+    items = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                try:
+                    items.append(Tweet.from_dict(json.loads(line)))
+                except (json.JSONDecodeError, KeyError, ValueError):
+                    log.warning(f"[!] Skipping unreadable line in {path}")
+    return items
+
+# Formats tweet data as plain text for output
+def format_tweets_as_text(tweets):
+    lines = []
+    for t in tweets:
+        tag = tweet_tag(t)
+
+        media_block = "None"
+        if t.media:
+            media_block = "\n".join(f"{m.type.value.capitalize()}: {m.url}" for m in t.media)
+
+        expanded_urls_block = "None"
+        if t.expanded_urls:
+            expanded_urls_block = "\n".join(t.expanded_urls)
+
+        tweet_lines = [
+            f"{tag}",
+            f"ID: {t.id}",
+            f"URL: {t.url}",
+        ]
+        if t.text is not None:
+            tweet_lines.append(f"Text: {t.text}")
+        elif t.retweet_full_text is not None:
+            tweet_lines.append(f"Retweet Full Text: {t.retweet_full_text}")
+        tweet_lines.extend([
+            f"Created: {t.created_at}",
+            f"Parent: {t.parent}",
+            f"Parent URL: {t.parent_url}",
+        ])
+        if t.thread:
+            tweet_lines.append("Thread:")
+            tweet_lines.extend(f"  @{a.username} ({a.id}): {a.text or a.retweet_full_text or ''}"
+                               for a in t.thread)
+        tweet_lines.extend([
+            f"Likes: {t.likes}",
+            f"Retweets: {t.retweets}",
+            f"Replies: {t.replies}",
+            f"Media:\n{media_block}",
+            f"Expanded URLs:\n{expanded_urls_block}",
+            "----------------------------------------"
+        ])
+        lines.append("\n".join(tweet_lines))
+    return "\n".join(lines)
+
+# Formats profile data as plain text for output
+def format_profile_as_text(profile):
+    lines = [
+        "Profile Information",
+        f"Username: {profile.get('screen_name', 'N/A')}",
+        f"Name: {profile.get('name', 'N/A')}",
+        f"Bio: {profile.get('description', 'N/A')}",
+        f"Location: {profile.get('location', 'N/A')}",
+        f"Followers: {profile.get('followers_count', 'N/A')}",
+        f"Following: {profile.get('friends_count', 'N/A')}",
+        f"Created At: {profile.get('created_at', 'N/A')}",
+        f"Profile Image URL: {profile.get('profile_image_url_https', 'N/A')}",
+        f"Profile Banner URL: {profile.get('profile_banner_url', 'N/A')}",
+        "----------------------------------------"
+    ]
+    return "\n".join(lines)
+
+# Returns a UserByScreenName payload's legacy profile with t.co links in the bio expanded,
+# or None when the payload has no user
+def parse_profile(data):
+    user_result = data.get("data", {}).get("user", {}).get("result", {})
+    legacy = user_result.get("legacy", {})
+    if not legacy:
+        return None
+    # Resolve t.co URLs in the description
+    description = legacy.get("description", "")
+    entities = legacy.get("entities", {})
+    description_urls = entities.get("description", {}).get("urls", [])
+    resolved_description = description
+    for url_info in description_urls:
+        tco_url = url_info.get("url", "")
+        expanded_url = url_info.get("expanded_url", tco_url)
+        if tco_url and expanded_url:
+            resolved_description = resolved_description.replace(tco_url, expanded_url)
+    legacy["description"] = resolved_description
+    return legacy
+
+# Looks profiles up straight from the UserByScreenName GraphQL endpoint. The first lookup
+# loads one profile page to capture the web app's request (query ID, features, headers);
+# every later lookup replays it with another screen_name, without a page. An ApiSession
+# has no pages and starts from the saved or built-in template instead.
+class ProfileFetcher:
+    def __init__(self, context, page_timeout=15, record=None, recorder=None):
+        self.context = context
+        self.page_timeout = page_timeout
+        self.record = record  # --record root; payloads go to <record>/<username>
+        self.recorder = recorder  # Or one shared Recorder, e.g. the tweet scrape's own
+        self.template = None  # (url, headers) of a captured UserByScreenName request
+        if isinstance(context, ApiSession):
+            self.template = (graphql_url("UserByScreenName"), {})
+        self.user_ids = {}  # username -> numeric user ID, for UserTweets requests
+        self.lock = asyncio.Lock()
+
+    # Remembers a UserByScreenName request seen on any page and returns its profile
+    async def capture(self, response, username):
+        if self.template is None:
+            headers = await response.request.all_headers()
+            self.template = (response.url, replay_headers(headers))
+            save_graphql_template(response.url, headers)
+        return self._parse(await response.json(), username, response.url)
+
+    # Returns the user's profile, or {} when it could not be fetched
+    async def lookup(self, username):
+        async with self.lock:
+            if self.template is None:
+                return await self._bootstrap(username)
+        url, headers = self.template
+        url = set_graphql_variables(url, screen_name=username)
+        try:
+            with metrics.timer("profile"):
+                r = await self.context.request.get(url, headers=headers, timeout=self.page_timeout * 1000)
+                body = await r.body()
+            metrics.request("UserByScreenName", r.status, len(body))
+            if r.status != 200:
+                log.warning(f"[!] Profile request for {username} failed: HTTP {r.status}")
+                return {}
+            return self._parse(json.loads(body), username, url)
+        except Exception as e:
+            log.warning(f"[!] Error processing profile response: {str(e)}")
+            return {}
+
+    # Loads the profile page once; completes as soon as the app's UserByScreenName call returns
+    async def _bootstrap(self, username):
+        page = await self.context.new_page()
+        try:
+            async with page.expect_response(lambda r: "UserByScreenName" in r.url,
+                                            timeout=self.page_timeout * 1000) as response_info:
+                await page.goto(f"https://x.com/{username}", timeout=60000)
+            return await self.capture(await response_info.value, username)
+        except PlaywrightTimeoutError:
+            log.warning(f"[!] No profile response for {username} within {self.page_timeout:g}s")
+            return {}
+        except Exception as e:
+            log.warning(f"[!] Error processing profile response: {str(e)}")
+            return {}
+        finally:
+            await page.close()
+
+    def _parse(self, data, username, url):
+        if self.recorder:
+            self.recorder.save("UserByScreenName", data, url=url)
+        elif self.record:
+            Recorder(Path(self.record) / username).save("UserByScreenName", data, url=url)
+        user_id = data.get("data", {}).get("user", {}).get("result", {}).get("rest_id")
+        if user_id:
+            self.user_ids[username] = user_id
+        profile = parse_profile(data)
+        if profile is None:
+            log.warning(f"[!] No profile data found for {username}")
+            return {}
+        log.info(f"[+] Successfully scraped profile for {username}")
+        return profile
+
+# Scrapes the user's profile bio and metadata
+async def scrape_user_profile(cfg, browser=None):
+    profiles = await scrape_profiles(cfg, [cfg.username], browser)
+    return profiles[cfg.username]
+
+# Looks up many profiles concurrently over one authenticated browser context
+async def scrape_profiles(cfg, usernames, browser=None):
+    if browser is None:
+        async with async_playwright() as p:
+            browser = await launch_browser(p, cfg)
+            try:
+                return await scrape_profiles(cfg, usernames, browser)
+            finally:
+                await browser.close()
+
+    block_stats = BlockStats()
+    context = await new_scrape_context(browser, cfg.block, block_stats, cookies=load_cookies(cfg.cookies[0]))
+    fetcher = ProfileFetcher(context, cfg.page_timeout, cfg.record)
+    limit = asyncio.Semaphore(max(1, cfg.concurrency))
+
+    async def lookup(name):
+        async with limit:
+            return await fetcher.lookup(name)
+
+    try:
+        results = await asyncio.gather(*(lookup(name) for name in usernames))
+    finally:
+        await context.close()
+        block_stats.report("profiles" if len(usernames) > 1 else usernames[0])
+    return dict(zip(usernames, results))
+
+# Returns the instruction list of a UserTweets or SearchTimeline payload
+def timeline_instructions(data, endpoint):
+    if endpoint == "UserTweets":
+        user_result = data.get("data", {}).get("user", {}).get("result", {})
+        for pth in (
+            user_result.get("timeline_v2", {}).get("timeline", {}).get("instructions"),
+            user_result.get("timeline", {}).get("timeline", {}).get("instructions"),
+            user_result.get("legacy", {}).get("timeline_v2", {}).get("timeline", {}).get("instructions"),
+        ):
+            if pth:
+                return pth
+        return []
+    # SearchTimeline
+    return (
+        data.get("data", {})
+            .get("search_by_raw_query", {})
+            .get("search_timeline", {})
+            .get("timeline", {})
+            .get("instructions", [])
+    )
+
+# Returns the long-form note_tweet text of a tweet result, if any
+def note_tweet_text(result):
+    return (
+        result.get("note_tweet", {})
+            .get("note_tweet_results", {})
+            .get("result", {})
+            .get("text", "")
+    )
+
+# Turns one tweet result into an output record without any I/O. Returns (record, pending),
+# or (None, None) when --type filters it out; `pending` names the network work still due:
+# TweetDetail hydration, hydration of a retweet's original, and t.co links to resolve.
+# `rt_hydrated` is the original's hydrated legacy, or False once that hydration failed.
+def normalize_tweet(t, tweet_id, endpoint, username, tweet_type="all", hydrated=False, rt_hydrated=None):
+    legacy = t.get("legacy", {})
+    pending = {"hydrate": False, "rt_orig_id": None, "tco_links": []}
+    # Hydration for UserTweets only
+    if not hydrated and endpoint == "UserTweets" and (
+        legacy.get("favorite_count", 0) == 0 and
+        legacy.get("retweet_count", 0) == 0 and
+        legacy.get("reply_count", 0) == 0
+    ):
+        pending["hydrate"] = True
+
+    # Handle note_tweet for extended text
+    full_text = WHITESPACE_RE.sub(" ", (note_tweet_text(t) or legacy.get("full_text", ""))).strip()
+
+    # Handle retweets
+    orig_full_text = ""
+    rt_legacy = None
+    if full_text.startswith("RT @"):
+        rt_status = legacy.get("retweeted_status_result", {}).get("result", {})
+        if rt_status:
+            rt_legacy = rt_status.get("legacy", {})
+            orig_full_text = WHITESPACE_RE.sub(" ", (note_tweet_text(rt_status) or rt_legacy.get("full_text", ""))).strip()
+        if not orig_full_text and endpoint == "UserTweets":
+            if rt_hydrated:
+                orig_full_text = WHITESPACE_RE.sub(" ", (note_tweet_text(rt_hydrated) or rt_hydrated.get("full_text", ""))).strip()
+                rt_legacy = rt_hydrated
+            elif rt_hydrated is None:
+                pending["rt_orig_id"] = legacy.get("retweeted_status_id_str")
+
+    is_rt = full_text.startswith("RT @")
+    is_rep = full_text.startswith("@")
+
+    if tweet_type == "tweets" and (is_rt or is_rep):
+        return None, None
+    if tweet_type == "retweets" and not is_rt:
+        return None, None
+
+    # Filter retweets: show only text or retweet_full_text
+    text_value = full_text
+    retweet_full_text = None
+    if is_rt and orig_full_text:
+        # Strip 'RT @username:' from text
+        stripped_text = RT_PREFIX_RE.sub("", full_text).strip()
+        # If orig_full_text provides more data, use it and exclude text
+        if orig_full_text != stripped_text and len(orig_full_text) > len(stripped_text):
+            text_value = None
+            retweet_full_text = orig_full_text
+
+    # Extract media (use retweeted tweet's legacy for retweets)
+    media = []
+    seen_urls = set()
+    media_source = rt_legacy if is_rt and rt_legacy else legacy
+    for key in ("extended_entities", "entities"):
+        for m in media_source.get(key, {}).get("media", []):
+            if m["type"] == "photo":
+                url = m["media_url_https"]
+                if url not in seen_urls:
+                    media.append(Media(MediaType.IMAGE, url))
+                    seen_urls.add(url)
+            elif m["type"] in ("video", "animated_gif"):
+                best = max(
+                    m.get("video_info", {}).get("variants", []),
+                    key=lambda v: v.get("bitrate", 0),
+                    default={}
+                )
+                url = best.get("url")
+                if url and url not in seen_urls:
+                    media.append(Media(MediaType.VIDEO, url))
+                    seen_urls.add(url)
+
+    # Extract expanded URLs from the retweeting tweet's legacy, then the retweeted one's
+    expanded_urls = []
+    seen_expanded_urls = set()
+    for source in (legacy, rt_legacy if is_rt else None):
+        if not source:
+            continue
+        for key in ("extended_entities", "entities"):
+            for u in source.get(key, {}).get("urls", []):
+                expanded_url = u.get("expanded_url")
+                if expanded_url and expanded_url not in seen_expanded_urls:
+                    expanded_urls.append(expanded_url)
+                    seen_expanded_urls.add(expanded_url)
+
+    # Fallback: If no expanded URLs found, the t.co links in the text get resolved
+    if not expanded_urls:
+        text_to_check = (text_value or "") + (" " + retweet_full_text if retweet_full_text else "")
+        pending["tco_links"] = list(dict.fromkeys(TCO_RE.findall(text_to_check)))
+
+    # Normalize tweet data; url and parent_url are derived from username and IDs
+    tweet_data = Tweet(
+        tweet_id, username, text_value, retweet_full_text,
+        parse_created_at(legacy.get("created_at")),
+        legacy.get("favorite_count", 0), legacy.get("retweet_count", 0),
+        legacy.get("reply_count", 0), legacy.get("bookmark_count", 0),
+        tuple(media), tuple(expanded_urls), legacy.get("in_reply_to_status_id_str", None),
+    )
+    if pending["hydrate"] or pending["rt_orig_id"]:
+        pending["result"] = t  # Raw result kept only when it must be normalized again
+    return tweet_data, pending
+
+# Side-effect-free timeline engine:
+# payload -> ([(tweet_id, endpoint, created, record, pending)], cursor).
+# `created` is the parsed timestamp, kept even for entries dropped by tweet_type.
+# Accepts parsed JSON or raw JSON text so it can run in a process pool.
+def normalize_timeline_payload(data, endpoint, username, tweet_type="all"):
+    if isinstance(data, (str, bytes)):
+        data = json.loads(data)
+    entries, cursor = [], None
+    for instr in timeline_instructions(data, endpoint):
+        for entry in instr.get("entries", []):
+            eid = entry.get("entryId", "")
+            if eid.startswith("tweet-"):
+                t = entry["content"]["itemContent"]["tweet_results"]["result"]
+                tweet_id = t.get("rest_id")
+                record, pending = (None, None)
+                if tweet_id:
+                    record, pending = normalize_tweet(t, tweet_id, endpoint, username, tweet_type)
+                if record is not None:
+                    created = record.created
+                else:
+                    created = parse_created_at(t.get("legacy", {}).get("created_at"))
+                entries.append((tweet_id, endpoint, created, record, pending))
+            elif eid.startswith("cursor-bottom"):
+                cursor = entry["content"]["value"]
+    return entries, cursor
+
+# Loads and normalizes a batch of recorded timeline files inside a pool worker
+def normalize_recorded_files(paths, username, tweet_type="all"):
+    results = []
+    for path in paths:
+        record = json.loads(Path(path).read_text(encoding="utf-8"))
+        results.append(normalize_timeline_payload(record["data"], record["endpoint"], username, tweet_type))
+    return results
+
+# Process pool shared by every scrape in this process for off-loop normalization
+@functools.lru_cache(maxsize=None)
+def get_parse_pool(workers):
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+# Returns the display tag of an output record
+def tweet_tag(t):
+    if t.retweet_full_text is not None:
+        return "[Retweet]"
+    if (t.text or "").strip().startswith("RT @"):
+        return "[Retweet]"
+    if t.parent:
+        return "[Reply]"
+    return "[Original]"
+
+# Turns timeline GraphQL payloads into output records; shared by live scrapes and replays
+class TimelineCollector:
+    def __init__(self, cfg, hydrator=None, tco_resolver=None, sink=None, state=None, pool=None,
+                 downloader=None):
+        self.cfg = cfg
+        self.downloader = downloader
+        self.pool = pool  # Optional ProcessPoolExecutor running normalize_timeline_payload
+        self.hydrator = hydrator
+        self.tco_resolver = tco_resolver
+        # With a sink, tweets are written out as they arrive instead of kept in `tweets`
+        self.sink = sink
+        self.state = state
+        self.tweets, self.seen_ids = [], set()
+        self.collected, self.collected_ids = 0, []
+        # Incremental runs skip everything at or below the user's stored high-water mark
+        self.known_ids = state.known_ids(cfg.username) if state else set()
+        self.high_water = state.newest_id(cfg.username) if state else 0
+        self.resume_id = state.resume_id(cfg.username) if state else None
+        self.first_run = not self.high_water and self.resume_id is None
+        # Walks stop at the mark, or further down at the resume bound an earlier run that
+        # stopped early left behind
+        self.stop_id = self.high_water if self.resume_id is None else self.resume_id
+        self.newest_seen = self.high_water
+        # Whether a walk reached `stop_id`, and whether this run left tweets behind through
+        # --max, a timeout or a failed hydration
+        self.caught_up, self.gaps = False, False
+        self.merging, self.queued = None, 0  # Latest merge task; tweets it has yet to write
+        # Tweets outside [since_after, before) are dropped before any enrichment
+        self.since_ts = cfg.since_after.timestamp() if cfg.since_after else None
+        self.before_ts = cfg.before.timestamp() if cfg.before else None
+
+    # Returns the reply ancestors of a tweet whose parent is `parent_id`, root first. One
+    # TweetDetail conversation holds the whole chain, so after the first lookup the rest
+    # are usually cache hits.
+    async def ancestry(self, parent_id):
+        chain, seen = [], set()
+        while parent_id and parent_id not in seen and len(chain) < THREAD_DEPTH:
+            seen.add(parent_id)
+            result = await self.hydrator.lookup(parent_id)
+            if not result:
+                break  # Deleted, protected or unreachable: the chain stops here
+            record, _ = normalize_tweet(result, parent_id, "TweetDetail", tweet_author(result),
+                                        hydrated=True, rt_hydrated=False)
+            if record is None:
+                break
+            chain.append(record)
+            parent_id = record.parent
+        chain.reverse()
+        return tuple(chain)
+
+    # Applies hydration and t.co resolution to a normalized record (None to drop it)
+    async def enrich(self, tweet_id, record, pending, endpoint):
+        username, tweet_type = self.cfg.username, self.cfg.type
+        t = pending.get("result")
+        if self.hydrator and pending["hydrate"]:
+            hyd = await self.hydrator.hydrate(tweet_id)
+            if not hyd:
+                log.warning(f"[!] Skipping tweet {tweet_id}: Hydration failed")
+                self.gaps = True
+                return None
+            t.setdefault("legacy", {}).update(hyd)
+            record, pending = normalize_tweet(t, tweet_id, endpoint, username, tweet_type, hydrated=True)
+            if record is None:
+                return None
+        if self.hydrator and pending["rt_orig_id"]:
+            hyd_orig = await self.hydrator.hydrate(pending["rt_orig_id"])
+            record, pending = normalize_tweet(t, tweet_id, endpoint, username, tweet_type,
+                                              hydrated=True, rt_hydrated=hyd_orig or False)
+            if record is None:
+                return None
+        if self.tco_resolver and pending["tco_links"]:
+            # Independent links in one tweet are resolved concurrently
+            resolved = await asyncio.gather(*(self.tco_resolver.resolve(u) for u in pending["tco_links"]))
+            for expanded_url in resolved:
+                if expanded_url and expanded_url not in record.expanded_urls:
+                    record.expanded_urls += (expanded_url,)
+        if self.downloader and record.media:
+            paths = await asyncio.gather(*(self.downloader.fetch(m.url) for m in record.media))
+            for m, path in zip(record.media, paths):
+                m.path = path
+        if self.cfg.threads and self.hydrator and record.parent:
+            record.thread = await self.ancestry(record.parent)
+        return record
+
+    # True for a tweet ID an earlier incremental run already collected
+    def is_known(self, tweet_id):
+        return tweet_id in self.known_ids or int(tweet_id) <= self.stop_id
+
+    # Normalizes one UserTweets/SearchTimeline payload (a dict, or raw JSON text with a
+    # process pool); returns its normalized entries and bottom cursor. The cursor goes back
+    # to the caller because several walks can share one collector.
+    async def process_timeline(self, data, endpoint):
+        with metrics.timer("parse"):
+            if self.pool:
+                loop = asyncio.get_running_loop()
+                entries, cursor = await loop.run_in_executor(
+                    self.pool, normalize_timeline_payload, data, endpoint, self.cfg.username, self.cfg.type
+                )
+            else:
+                entries, cursor = normalize_timeline_payload(data, endpoint, self.cfg.username, self.cfg.type)
+        return await self.process_normalized(entries), cursor
+
+    # Dedups normalized entries and starts enriching them; returns the entries so callers can
+    # tell an empty page and inspect the IDs reached. The page is released as soon as its
+    # enrichments are scheduled: they are merged in timeline order by a chain of merge
+    # tasks, so the next page can be requested while TweetDetail calls are in flight.
+    async def process_normalized(self, entries):
+        items = []
+        for tweet_id, endpoint, created, record, pending in entries:
+            if tweet_id and tweet_id.isdigit() and self.is_known(tweet_id):
+                continue  # Collected by an earlier run
+            if not tweet_id or tweet_id in self.seen_ids:
+                log.warning(f"[!] Skipping tweet {tweet_id}: Already processed or invalid ID")
+                continue
+            self.seen_ids.add(tweet_id)
+            if created is not None and (
+                (self.since_ts is not None and created < self.since_ts) or
+                (self.before_ts is not None and created >= self.before_ts)
+            ):
+                continue  # Outside the date window
+            if tweet_id.isdigit():
+                self.newest_seen = max(self.newest_seen, int(tweet_id))
+            if record is None:
+                continue  # Dropped by --type
+            if (pending["hydrate"] or pending["rt_orig_id"] or pending["tco_links"]
+                    or (self.downloader and record.media) or (self.cfg.threads and record.parent)):
+                items.append(asyncio.ensure_future(self.enrich(tweet_id, record, pending, endpoint)))
+            else:
+                items.append(record)
+        if items:
+            self.queued += len(items)
+            self.merging = asyncio.ensure_future(self.merge(items, self.merging))
+        return entries
+
+    # Waits for the previous page's merge, then writes this page's tweets in order
+    async def merge(self, items, previous):
+        try:
+            if previous:
+                await previous
+            for item in items:
+                if self.collected >= self.cfg.max:
+                    self.gaps = True
+                    break
+                try:
+                    tweet_data = await item if isinstance(item, asyncio.Future) else item
+                except Exception as e:
+                    log.warning(f"[!] Error processing tweet entry: {str(e)}")
+                    self.gaps = True
+                    continue
+                if tweet_data is None:
+                    continue
+                # Display progress: Truncate text to 50 characters for readability
+                display_text = (tweet_data.text or tweet_data.retweet_full_text or "No text")
+                if len(display_text) > 50:
+                    display_text = display_text[:47] + "..."
+                log.info(f"Scraping tweet {tweet_data.id} {tweet_tag(tweet_data)}: {display_text}",
+                         extra={"fields": {"tweet_id": tweet_data.id, "username": tweet_data.username,
+                                           "tag": tweet_tag(tweet_data).strip("[]").lower()}})
+                metrics.count("tweets")
+                if self.sink:
+                    self.sink.write(tweet_data)
+                else:
+                    self.tweets.append(tweet_data)
+                if self.state:
+                    self.collected_ids.append(tweet_data.id)
+                self.collected += 1
+        finally:
+            self.queued -= len(items)
+            for item in items:
+                if isinstance(item, asyncio.Future):
+                    item.cancel()
+
+    # Waits until every scheduled tweet has been merged
+    async def drain(self):
+        if self.merging:
+            await self.merging
+
+    # Stops merges and enrichments still pending when a run is torn down
+    def cancel(self):
+        if self.merging:
+            self.merging.cancel()
+
+    # Sorts the in-memory tweets, records incremental state and returns the result. The mark
+    # moves to the newest tweet reached; after an early stop the old stop point is kept as
+    # the resume bound, so the next run walks past the mark and picks up what this one
+    # missed. A first run has nothing to resume: its walk started at the top, so what it
+    # collected is the newest part of the timeline.
+    def finish(self):
+        sort_tweets(self.tweets)
+        if self.state:
+            if self.first_run:
+                newest = max(map(int, self.collected_ids), default=0) if self.gaps else self.newest_seen
+                resume = None
+            else:
+                newest = self.newest_seen
+                resume = self.stop_id if self.gaps or not self.caught_up else None
+            try:
+                self.state.record(self.cfg.username, self.collected_ids, newest, resume)
+            finally:
+                self.state.close()
+        return self.tweets[:self.cfg.max]
+
+# Scrapes tweets or retweets from a user's timeline. With `on_profile`, the profile the
+# timeline page loads anyway is passed to it as well. A given `context` (e.g. a warm one
+# from `serve`) is used as is and left open.
+async def scrape_user_tweets(cfg, browser=None, sink=None, on_profile=None, context=None):
+    if browser is None and context is None:
+        async with async_playwright() as p:
+            browser = await launch_browser(p, cfg)
+            try:
+                return await scrape_user_tweets(cfg, browser, sink, on_profile)
+            finally:
+                await browser.close()
+
+    block_stats = BlockStats()
+    accounts = AccountPool()
+    own_context = context is None
+    if own_context:
+        for path in cfg.cookies:
+            account_context = await new_scrape_context(browser, cfg.block, block_stats,
+                                                       cookies=load_cookies(path))
+            await accounts.add(Path(path).stem, account_context)
+        context = accounts.accounts[0].context
+    else:
+        await accounts.add("default", context)
+    n_accounts = len(accounts.accounts)
+    recorder = Recorder(Path(cfg.record) / cfg.username) if cfg.record else None
+    # Hydration limits are per account, so throughput grows with the pool
+    detail_cache = DetailCache(cfg.detail_cache, ttl=cfg.detail_cache_ttl * 86400,
+                               max_entries=cfg.detail_cache_size) if cfg.detail_cache else None
+    hydrator = Hydrator(accounts, workers=cfg.hydrate_workers * n_accounts,
+                        rate=cfg.hydrate_rate * n_accounts, recorder=recorder, cache=detail_cache)
+    tco_cache = TcoCache(cfg.tco_cache, ttl=cfg.tco_cache_ttl * 86400,
+                         max_entries=cfg.tco_cache_size) if cfg.tco_cache else None
+    tco_resolver = TcoResolver(context.request, tco_cache, recorder=recorder)
+    state = StateStore(cfg.state) if cfg.incremental else None
+    pool = get_parse_pool(cfg.parse_workers) if cfg.parse_workers else None
+    downloader = MediaDownloader(cfg.download_media, cfg.download_workers,
+                                 cfg.download_rate * 1e6) if cfg.download_media else None
+    collector = TimelineCollector(cfg, hydrator, tco_resolver, sink, state, pool, downloader)
+    # Without a browser every page is requested directly, starting from the user's ID
+    api = isinstance(context, ApiSession)
+    profile_fetcher = ProfileFetcher(context, cfg.page_timeout, recorder=recorder) if on_profile or api else None
+
+    # Builds the first GraphQL page URL for a profile or search URL, for ApiSessions
+    async def api_timeline_url(start_url):
+        if "/search?" in start_url:
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(start_url).query)["q"][0]
+            return graphql_url("SearchTimeline", rawQuery=query)
+        profile = await profile_fetcher.lookup(cfg.username)
+        if profile and on_profile:
+            on_profile(profile)
+        user_id = profile_fetcher.user_ids.get(cfg.username)
+        if not user_id:
+            log.warning(f"[!] Could not look up the user ID of {cfg.username}")
+            return None
+        return graphql_url("UserTweets", userId=user_id)
+
+    # Walks one timeline or search URL on its own page. Returns the oldest tweet ID seen
+    # when the page budget ran out before the timeline did, otherwise None.
+    async def walk(start_url):
+        walk_endpoint = "SearchTimeline" if "/search?" in start_url else "UserTweets"
+        account = accounts.pick(walk_endpoint) or accounts.accounts[0]
+        timeline_request = None  # (endpoint, url, headers) of the first timeline call
+        page_processed = asyncio.Event()  # Set each time a timeline response has been handled
+        oldest_id = None
+        next_cursor = None  # Bottom cursor of this walk's latest page
+        passed_since = False  # A whole page was older than --since-after
+        reached_known = False  # This walk reached the high-water mark of an earlier run
+
+        # Normalizes a timeline payload and tracks the oldest tweet and the bottom cursor
+        # this walk reached; returns the entries and the cursor
+        async def process(data, endpoint):
+            nonlocal oldest_id, next_cursor, passed_since, reached_known
+            entries, cursor = await collector.process_timeline(data, endpoint)
+            if cursor:
+                next_cursor = cursor
+            ids = [e[0] for e in entries if e[0] and e[0].isdigit()]
+            if ids:
+                oldest_id = min([int(i) for i in ids] + ([oldest_id] if oldest_id else []))
+                # Only the mark ends a walk: IDs above it may be the newest part of a run
+                # that stopped early, with uncollected tweets below them
+                if any(int(i) <= collector.stop_id for i in ids):
+                    reached_known = collector.caught_up = True
+            # Timelines run newest first, so one stale tweet (e.g. a pinned one) is not
+            # enough; paging stops once every dated entry on a page is older
+            dated = [e[2] for e in entries if e[2] is not None]
+            if collector.since_ts is not None and dated and max(dated) < collector.since_ts:
+                passed_since = True
+            return entries, cursor
+
+        # True once this walk should stop paging; stopping at --max leaves tweets behind.
+        # Near --max the pending merges are awaited first, since enrichment may still drop
+        # some of them and leave room for another page.
+        async def done():
+            if reached_known or passed_since:
+                return True
+            if collector.collected + collector.queued >= cfg.max:
+                await collector.drain()
+                if collector.collected >= cfg.max:
+                    collector.gaps = True
+                    return True
+            return False
+
+        async def handle_response(response):
+            nonlocal timeline_request
+            endpoint = timeline_endpoint(response.url)
+            if profile_fetcher and profile_fetcher.template is None and "UserByScreenName" in response.url:
+                try:
+                    profile = await profile_fetcher.capture(response, cfg.username)
+                    if profile:
+                        on_profile(profile)
+                except Exception as e:
+                    log.warning(f"[!] Error processing profile response: {str(e)}")
+            if endpoint:
+                accounts.observe(account, endpoint, response.status, response.headers)
+                try:
+                    if timeline_request is None:
+                        # Remember the app's own request so cursor paging can replay it
+                        headers = await response.request.all_headers()
+                        timeline_request = (endpoint, response.url, replay_headers(headers))
+                        save_graphql_template(response.url, headers)
+                    # With a pool the raw body is parsed by the worker, not on the event loop
+                    body = await response.body()
+                    metrics.request(endpoint, response.status, len(body))
+                    data = body if pool else json.loads(body)
+                    if recorder:
+                        recorder.save(endpoint, json.loads(data) if pool else data, url=response.url)
+                    await process(data, endpoint)
+                except Exception as e:
+                    log.warning(f"[!] Error processing response: {str(e)}")
+                    collector.gaps = True
+                finally:
+                    page_processed.set()
+
+        # Waits for the first timeline page the web app requests after navigation
+        async def wait_for_first_page():
+            try:
+                with metrics.timer("first_page_wait"):
+                    await asyncio.wait_for(page_processed.wait(), timeout=cfg.page_timeout)
+                return True
+            except asyncio.TimeoutError:
+                log.warning(f"[!] No timeline response within {cfg.page_timeout:g}s")
+                collector.gaps = True
+                return False
+
+        # Scrolls the page and waits for the timeline request each scroll triggers
+        async def paginate_with_scroll():
+            if not await wait_for_first_page():
+                return False
+            for _ in range(cfg.scrolls):
+                if await done():
+                    return False
+                started = time.monotonic()
+                page_processed.clear()
+                try:
+                    with metrics.timer("scroll_wait"):
+                        async with page.expect_response(lambda r: timeline_endpoint(r.url) is not None,
+                                                        timeout=cfg.page_timeout * 1000):
+                            await page.evaluate("() => window.scrollTo(0, document.body.scrollHeight)")
+                except PlaywrightTimeoutError:
+                    log.warning(f"[!] No new timeline page within {cfg.page_timeout:g}s; stopping")
+                    collector.gaps = True
+                    return False
+                await page_processed.wait()
+                # --delay is only a politeness floor between page requests
+                remaining = cfg.delay - (time.monotonic() - started)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+            return not await done()  # The page budget ran out before the walk was done
+
+        # Requests the following timeline pages directly with the captured bottom cursor
+        async def paginate_with_cursor():
+            if not await wait_for_first_page() or timeline_request is None:
+                collector.gaps = True
+                return False
+            endpoint, base_url, headers = timeline_request
+            return await request_pages(endpoint, base_url, headers, next_cursor)
+
+        # Requests timeline pages directly: the first page when `cursor` is None (no
+        # browser), then the page after each bottom cursor
+        async def request_pages(endpoint, base_url, headers, cursor):
+            first = cursor is None
+            used_cursors = set()
+            last_request = float("-inf") if first else time.monotonic()
+            for _ in range(cfg.scrolls + first):
+                if await done() or (not first and (not cursor or cursor in used_cursors)):
+                    return False
+                used_cursors.add(cursor)
+                # --delay is only a politeness floor between page requests
+                remaining = cfg.delay - (time.monotonic() - last_request)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                last_request = time.monotonic()
+                page_url = base_url if first else set_graphql_cursor(base_url, cursor)
+                first = False
+                with metrics.timer("page_request"):
+                    r = await accounts.get(page_url, headers=headers, timeout=cfg.page_timeout * 1000)
+                    body = await r.body()
+                metrics.request(endpoint, r.status, len(body))
+                if r.status != 200:
+                    log.warning(f"[!] {endpoint} page request failed: HTTP {r.status}")
+                    collector.gaps = True
+                    return False
+                data = body if pool else json.loads(body)
+                if recorder:
+                    recorder.save(endpoint, json.loads(data) if pool else data, url=page_url)
+                entries, cursor = await process(data, endpoint)
+                if not entries:
+                    return False  # Empty page: end of the timeline
+            return not await done()
+
+        if api:
+            base_url = await api_timeline_url(start_url)
+            if base_url is None:
+                collector.gaps = True
+                return None
+            return oldest_id if await request_pages(walk_endpoint, base_url, None, None) else None
+
+        page = await account.context.new_page()
+        page.on("response", handle_response)
+        try:
+            with metrics.timer("page_load"):
+                await page.goto(start_url, timeout=60000)
+            if cfg.pagination == "cursor":
+                truncated = await paginate_with_cursor()
+            else:
+                truncated = await paginate_with_scroll()
+            return oldest_id if truncated else None
+        finally:
+            await page.close()
+
+    # Runs date windows as separate search walks; a window whose walk runs out of pages
+    # is dense, so the part older than what it reached is split and queued again
+    async def walk_date_windows():
+        queue = asyncio.Queue()
+        end = cfg.before or datetime.now(timezone.utc)
+        # `until:` is exclusive, so without --before the newest window stays open-ended
+        # rather than dropping today's tweets
+        open_end = None if cfg.before else end
+        for window in date_windows(cfg.since_after, end, cfg.shard_days):
+            queue.put_nowait(window)
+
+        async def shard_worker():
+            while True:
+                since, until = await queue.get()
+                try:
+                    if collector.collected >= cfg.max:
+                        collector.gaps = True
+                        continue
+                    oldest_id = await walk(search_url(cfg.username, since, None if until == open_end else until))
+                    if oldest_id is None:
+                        continue
+                    # `until` is exclusive, so the remainder keeps the oldest reached day
+                    reached = snowflake_time(oldest_id).replace(hour=0, minute=0, second=0, microsecond=0)
+                    new_until = reached + timedelta(days=1)
+                    if not since or new_until >= until or new_until <= since:
+                        collector.gaps = True  # The rest of the window is not walked
+                        continue
+                    log.info(f"[*] Dense window {since:%Y-%m-%d}..{until:%Y-%m-%d}; "
+                             f"re-queuing {since:%Y-%m-%d}..{new_until:%Y-%m-%d}")
+                    for window in split_window(since, new_until):
+                        queue.put_nowait(window)
+                except Exception as e:
+                    log.warning(f"[!] Search window {since}..{until} failed: {str(e)}")
+                    collector.gaps = True
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.ensure_future(shard_worker()) for _ in range(max(1, cfg.shard_workers))]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    # X search does not return retweets, so those walk the profile timeline by default
+    date_mode = cfg.date_mode
+    if date_mode == "auto":
+        date_mode = "timeline" if cfg.type == "retweets" else "search"
+
+    try:
+        if date_mode == "search" and cfg.since_after:
+            await walk_date_windows()
+        else:
+            start_url = (search_url(cfg.username, None, cfg.before) if date_mode == "search" and cfg.before
+                         else f"https://x.com/{cfg.username}")
+            if await walk(start_url) is not None:
+                collector.gaps = True  # --scrolls ran out before the timeline did
+        await collector.drain()
+    finally:
+        collector.cancel()
+        hydrator.cancel()
+        tco_resolver.cancel()
+        if downloader:
+            downloader.cancel()
+        if own_context:
+            await accounts.close()
+        block_stats.report(cfg.username)
+        if tco_cache:
+            tco_cache.close()
+        if detail_cache:
+            detail_cache.close()
+        if downloader:
+            downloader.report()
+            downloader.close()
+
+    # Sort tweets by created_at (newest to oldest)
+    return collector.finish()
+
+# Runs recorded timeline payloads through the normal collector, without a browser
+async def replay_recording(cfg, directory, sink=None):
+    paths = sorted(Path(directory).glob("*.json"))
+    endpoint_of = lambda p: p.stem.split("_", 1)[-1]
+    side = [json.loads(p.read_text(encoding="utf-8")) for p in paths if endpoint_of(p) in ("TweetDetail", "tco")]
+    details = {r["key"]: r["data"] for r in side if r["endpoint"] == "TweetDetail"}
+    links = {r["key"]: r["data"] for r in side if r["endpoint"] == "tco"}
+    timeline_paths = [str(p) for p in paths if endpoint_of(p) in TIMELINE_ENDPOINTS]
+    collector = TimelineCollector(cfg, ReplayHydrator(details), ReplayTcoResolver(links), sink)
+
+    if not cfg.parse_workers:
+        for path in timeline_paths:
+            if collector.collected >= cfg.max:
+                break
+            with metrics.timer("parse"):
+                entries, _ = normalize_recorded_files([path], cfg.username, cfg.type)[0]
+            await collector.process_normalized(entries)
+        await collector.drain()
+        return collector.finish()
+
+    # Batches of files are normalized across cores; a bounded window keeps results in order
+    pool = get_parse_pool(cfg.parse_workers)
+    loop = asyncio.get_running_loop()
+    window = collections.deque()
+
+    async def merge_oldest():
+        with metrics.timer("parse_wait"):
+            batch = await window.popleft()
+        for entries, _ in batch:
+            await collector.process_normalized(entries)
+
+    for i in range(0, len(timeline_paths), REPLAY_BATCH):
+        if collector.collected >= cfg.max:
+            break
+        batch = timeline_paths[i:i + REPLAY_BATCH]
+        window.append(loop.run_in_executor(pool, normalize_recorded_files, batch, cfg.username, cfg.type))
+        if len(window) >= cfg.parse_workers * 2:
+            await merge_oldest()
+    while window and collector.collected < cfg.max:
+        await merge_oldest()
+    for future in window:
+        future.cancel()
+    await collector.drain()
+    return collector.finish()
+
+# Reads one username per line, skipping blanks, comments and duplicates
+def read_usernames(file_path):
+    names = []
+    for line in Path(file_path).read_text(encoding="utf-8").splitlines():
+        name = line.split("#", 1)[0].strip().lstrip("@")
+        if name:
+            names.append(name)
+    return list(dict.fromkeys(names))
 
-# Fetches detailed tweet data when engagement counts are zero
-async def hydrate_full_tweet(tweet_id, page, original_legacy=None):
+# Merges newly scraped tweets into a previous run's output for incremental mode
+def merge_with_existing(out_file, tweets):
+    path = Path(out_file)
+    if not path.exists():
+        return tweets
+    if out_file.lower().endswith(".txt"):
+        return tweets  # Text output is merged by prepending, see save_results
     try:
-        variables = {
-            "focalTweetId": tweet_id,
-            "with_rux_injections": False,
-            "includePromotedContent": False,
-            "withCommunity": True,
-            "withQuickPromoteEligibilityTweetFields": True,
-            "withBirdwatchNotes": False,
-            "withVoice": True,
-            "withV2Timeline": True
-        }
-        q = urllib.parse.quote(json.dumps(variables))
-        url = ("https://x.com/i/api/graphql/TweetDetailID/"
-               f"TweetDetail?variables={q}")
-        r = await page.request.get(url)
-        if r.status != 200:
-            print(f"[!] Hydration failed for tweet {tweet_id}: HTTP {r.status}")
-            return original_legacy
-        data = await r.json()
-        instrs = (
-            data.get("data", {})
-                .get("threaded_conversation_with_injections_v2", {})
-                .get("instructions", [])
-        )
-        for instr in instrs:
-            for entry in instr.get("entries", []):
-                if entry.get("entryId", "").startswith("tweet-"):
-                    res = entry["content"]["itemContent"]["tweet_results"]["result"]
-                    await asyncio.sleep(0.5)  # Delay to avoid rate limiting
-                    return res.get("legacy", {})
-        print(f"[!] Hydration failed for tweet {tweet_id}: No tweet entry found")
-        return original_legacy
+        previous = [Tweet.from_dict(d) for d in json.loads(path.read_text(encoding="utf-8"))]
     except Exception as e:
-        print(f"[!] Hydration failed for tweet {tweet_id}: {str(e)}")
-        return original_legacy
+        log.warning(f"[!] Could not read existing output {out_file} for merging: {e}")
+        return tweets
+    new_ids = {t.id for t in tweets}
+    merged = tweets + [t for t in previous if t.id not in new_ids]
+    log.info(f"[+] Merged {len(tweets)} new items into {len(previous)} existing items")
+    return sort_tweets(merged)
 
-# Formats tweet data as plain text for output
-def format_tweets_as_text(tweets):
-    lines = []
-    for t in tweets:
-        tag = "[Original]"
-        if t.get("retweet_full_text") is not None:
-            tag = "[Retweet]"
-        elif t.get("text", "").strip().startswith("RT @"):
-            tag = "[Retweet]"
-        elif t.get("parent"):
-            tag = "[Reply]"
+# Picks a streaming sink for the output file, or None to collect tweets in memory
+def open_sink(cfg, out_file):
+    lower = out_file.lower()
+    if cfg.type == "bio":
+        return None
+    if sqlite_output_path(out_file):
+        return SqliteSink(out_file)
+    if lower.endswith(".parquet"):
+        if pyarrow is not None:
+            return ParquetSink(out_file, cfg.row_group_size)
+        csv_file = str(Path(out_file).with_suffix(".csv"))
+        log.warning(f"[!] pyarrow is not installed; writing CSV to {csv_file} instead of Parquet")
+        return CsvSink(csv_file, cfg.row_group_size, append=cfg.incremental)
+    if lower.endswith(".csv"):
+        return CsvSink(out_file, cfg.row_group_size, append=cfg.incremental)
+    if lower.endswith((".ndjson", ".jsonl")):
+        return StreamSink(out_file, "ndjson", append=cfg.incremental)
+    if not cfg.stream:
+        return None
+    if lower.endswith(".txt"):
+        return StreamSink(out_file, "text", append=cfg.incremental)
+    # Spool as NDJSON, then turn it into the sorted, indented .json form after the run
+    return StreamSink(out_file + ".ndjson", "ndjson")
 
-        media_block = "None"
-        if t.get("media"):
-            media_block = "\n".join(f"{m['type'].capitalize()}: {m['url']}"
-                                    for m in t["media"])
+# Returns where a tweet output's companion profile goes: <stem>_profile.json or .txt, or
+# the same database for SQLite output
+def profile_output(out_file):
+    if sqlite_output_path(out_file):
+        return out_file
+    path = Path(out_file)
+    suffix = ".txt" if path.suffix.lower() == ".txt" else ".json"
+    return str(path.with_name(f"{path.stem}_profile{suffix}"))
 
-        expanded_urls_block = "None"
-        if t.get("expanded_urls"):
-            expanded_urls_block = "\n".join(t["expanded_urls"])
+# Returns an on_profile callback that saves the profile a --type all scrape sees, or None
+def profile_saver(cfg, out_file):
+    if cfg.type != "all":
+        return None
+    profile_cfg = copy.copy(cfg)
+    profile_cfg.type = "bio"
+    return lambda profile: save_results(profile_cfg, profile, profile_output(out_file))
 
-        tweet_lines = [
-            f"{tag}",
-            f"ID: {t['id']}",
-            f"URL: {t['url']}",
-        ]
-        if t.get("text") is not None:
-            tweet_lines.append(f"Text: {t['text']}")
-        elif t.get("retweet_full_text") is not None:
-            tweet_lines.append(f"Retweet Full Text: {t['retweet_full_text']}")
-        tweet_lines.extend([
-            f"Created: {t.get('created_at','?')}",
-            f"Parent: {t.get('parent')}",
-            f"Parent URL: {t.get('parent_url')}",
-            f"Likes: {t.get('likes') or t.get('favorite_count')}",
-            f"Retweets: {t.get('retweets') or t.get('retweet_count')}",
-            f"Replies: {t.get('replies')}",
-            f"Media:\n{media_block}",
-            f"Expanded URLs:\n{expanded_urls_block}",
-            "----------------------------------------"
-        ])
-        lines.append("\n".join(tweet_lines))
-    return "\n".join(lines)
+# Writes scraped tweets or a profile to a .json or .txt file
+def save_results(cfg, result, out_file, sink=None):
+    spool = None
+    if sink:
+        sink.close()
+        if sink.path != f"{out_file}.ndjson":
+            log.info(f"[+] Saved → {sink.path}")
+            return
+        spool = sink.path
+        result = sort_tweets(read_ndjson(spool))
+    if cfg.type == "bio" and out_file.lower().endswith((".parquet", ".csv")):
+        out_file = profile_output(out_file)  # A single profile goes to <stem>_profile.json
+    if sqlite_output_path(out_file):
+        db = SqliteSink(out_file)
+        try:
+            if cfg.type == "bio":
+                if result:
+                    db.write_profile(cfg.username, result)
+            else:
+                for tweet in result:
+                    db.write(tweet)
+        finally:
+            db.close()
+        log.info(f"[+] Saved → {out_file}")
+        return
+    # For bio, result is a single dict, but we wrap it in a list for consistency
+    result_list = ([result] if result else []) if cfg.type == "bio" else result
+    previous_text = ""
+    if cfg.incremental and cfg.type != "bio":
+        result_list = merge_with_existing(out_file, result_list)
+        if out_file.lower().endswith(".txt") and Path(out_file).exists():
+            previous_text = Path(out_file).read_text(encoding="utf-8")
+    try:
+        with open(out_file, "w", encoding="utf-8") as fh:
+            if out_file.lower().endswith(".txt"):
+                if cfg.type == "bio":
+                    fh.write(format_profile_as_text(result))
+                else:
+                    fh.write(format_tweets_as_text(result_list))
+                    if previous_text:
+                        fh.write("\n" + previous_text if result_list else previous_text)
+            else:
+                if cfg.type != "bio":
+                    result_list = [t.to_dict() for t in result_list]
+                json.dump(result_list, fh, indent=2, ensure_ascii=False)
+        if spool:
+            Path(spool).unlink()  # Only dropped once the final file is written
+        log.info(f"[+] Saved → {out_file}")
+    except Exception as e:
+        log.warning(f"[!] Write failed: {e}")
 
-# Formats profile data as plain text for output
-def format_profile_as_text(profile):
-    lines = [
-        "Profile Information",
-        f"Username: {profile.get('screen_name', 'N/A')}",
-        f"Name: {profile.get('name', 'N/A')}",
-        f"Bio: {profile.get('description', 'N/A')}",
-        f"Location: {profile.get('location', 'N/A')}",
-        f"Followers: {profile.get('followers_count', 'N/A')}",
-        f"Following: {profile.get('friends_count', 'N/A')}",
-        f"Created At: {profile.get('created_at', 'N/A')}",
-        f"Profile Image URL: {profile.get('profile_image_url_https', 'N/A')}",
-        f"Profile Banner URL: {profile.get('profile_banner_url', 'N/A')}",
-        "----------------------------------------"
-    ]
-    return "\n".join(lines)
+# Runs one username job on a shared browser and saves it to the per-user output;
+# returns the number of items collected. Errors propagate to the caller.
+async def scrape_user_job(cfg, browser, name, job_type=None):
+    user_cfg = copy.copy(cfg)
+    user_cfg.username = name
+    user_cfg.type = job_type or cfg.type
+    out_file = cfg.output.format(username=name)
+    if user_cfg.type == "bio":
+        profile = await scrape_user_profile(user_cfg, browser)
+        if not profile:
+            raise RuntimeError(f"no profile found for {name}")
+        save_results(user_cfg, profile, out_file)
+        return 1
+    sink = None
+    try:
+        sink = open_sink(user_cfg, out_file)
+        result = await scrape_user_tweets(user_cfg, browser, sink, profile_saver(user_cfg, out_file))
+        count = sink.count if sink else len(result)
+        log.info(f"[+] Collected {count} items for {name}")
+        save_results(user_cfg, result, out_file, sink)
+        return count
+    finally:
+        if sink:
+            sink.close()
+
+# Scrapes many usernames over one shared browser, one context per job
+async def scrape_batch(cfg, usernames):
+    for path in cfg.cookies:
+        load_cookies(path)  # Fail fast on bad cookies before launching anything
+    queue = asyncio.Queue()
+    for name in usernames:
+        queue.put_nowait(name)
+    failed = []
 
-# Scrapes the user's profile bio and metadata
-async def scrape_user_profile(cfg):
-    profile_data = {}
-    
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=cfg.headless)
-        context = await browser.new_context(
-            user_agent=get_random_user_agent(),
-            locale=get_random_lang(),
-            viewport={"width": 1280, "height": 800}
-        )
+        browser = await launch_browser(p, cfg)
 
+        async def worker():
+            while True:
+                try:
+                    name = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    await scrape_user_job(cfg, browser, name)
+                except Exception as e:
+                    # A single bad account must not take the rest of the batch down
+                    log.warning(f"[!] Batch job failed for {name}: {e}")
+                    failed.append(name)
+
+        workers = max(1, min(cfg.concurrency, len(usernames)))
         try:
-            with open(COOKIE_PATH) as fh:
-                cookie_data = json.load(fh)
-            cookies = cookie_data if isinstance(cookie_data, list) else cookie_data.get("cookies", [])
-            await context.add_cookies(cookies)
-        except Exception as e:
-            print(f"[!] Cookie error: {e}. Please update x_cookies.json with valid cookies.")
-            sys.exit(1)
+            if cfg.type == "bio":
+                # Profiles need no page per user: one context serves every lookup
+                profiles = await scrape_profiles(cfg, usernames, browser)
+                for name, profile in profiles.items():
+                    user_cfg = copy.copy(cfg)
+                    user_cfg.username = name
+                    if profile:
+                        save_results(user_cfg, profile, cfg.output.format(username=name))
+                    else:
+                        failed.append(name)
+            else:
+                await asyncio.gather(*(worker() for _ in range(workers)))
+        finally:
+            await browser.close()
 
-        page = await context.new_page()
+    log.info(f"[+] Batch finished: {len(usernames) - len(failed)}/{len(usernames)} users succeeded")
+    if failed:
+        log.warning(f"[!] Failed users: {', '.join(failed)}")
+    return failed
 
-        async def handle_response(response):
-            nonlocal profile_data
-            if "UserByScreenName" in response.url:
-                try:
-                    data = await response.json()
-                    user_result = data.get("data", {}).get("user", {}).get("result", {})
-                    legacy = user_result.get("legacy", {})
-                    if legacy:
-                        # Resolve t.co URLs in the description
-                        description = legacy.get("description", "")
-                        entities = legacy.get("entities", {})
-                        description_urls = entities.get("description", {}).get("urls", [])
-                        resolved_description = description
-                        for url_info in description_urls:
-                            tco_url = url_info.get("url", "")
-                            expanded_url = url_info.get("expanded_url", tco_url)
-                            if tco_url and expanded_url:
-                                resolved_description = resolved_description.replace(tco_url, expanded_url)
-                        legacy["description"] = resolved_description
-                        profile_data = legacy
-                        print(f"[+] Successfully scraped profile for {cfg.username}")
-                    else:
-                        print(f"[!] No profile data found for {cfg.username}")
-                except Exception as e:
-                    print(f"[!] Error processing profile response: {str(e)}")
+# Claims username jobs from a shared JobQueue until it is drained (or forever with
+# `wait`), running up to --concurrency of them over one browser. Each running job's
+# lease is renewed in the background; a job whose lease is lost is abandoned, since
+# another worker may already have picked it up.
+async def run_worker(cfg, queue_path, lease=600, wait=False):
+    for path in cfg.cookies:
+        load_cookies(path)
+    queue = JobQueue(queue_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    done = failed = 0
 
-        page.on("response", handle_response)
+    async def heartbeat(job, task):
+        while True:
+            await asyncio.sleep(lease / 3)
+            if not queue.renew(job["id"], worker, lease):
+                log.warning(f"[!] Lost the lease on {job['username']}, abandoning it")
+                task.cancel()
+                return True
 
-        # Use the UserByScreenName GraphQL endpoint to fetch the profile
-        variables = {
-            "screen_name": cfg.username,
-            "withSafetyModeUserFields": True,
-            "withSuperFollowsUserFields": True
-        }
-        q = urllib.parse.quote(json.dumps(variables))
-        url = f"https://x.com/i/api/graphql/UserByScreenName?variables={q}"
-        await page.goto(f"https://x.com/{cfg.username}", timeout=60000)
-        await asyncio.sleep(2)  # Wait for the API response
+    async def slot(browser):
+        nonlocal done, failed
+        while True:
+            job = queue.claim(worker, lease)
+            if job is None:
+                if not wait:
+                    return
+                await asyncio.sleep(5)
+                continue
+            name = job["username"]
+            log.info(f"[*] Job {job['id']}: {name} ({job['type']}, attempt {job['attempt']})")
+            started = time.monotonic()
+            task = asyncio.ensure_future(scrape_user_job(cfg, browser, name, job["type"]))
+            beat = asyncio.ensure_future(heartbeat(job, task))
+            try:
+                items = await task
+            except asyncio.CancelledError:
+                if not (beat.done() and beat.result()):
+                    raise  # The worker itself is shutting down
+                failed += 1
+                continue
+            except Exception as e:
+                log.warning(f"[!] Job {job['id']} failed for {name}: {e}")
+                queue.fail(job["id"], worker, e)
+                metrics.count("jobs_failed")
+                failed += 1
+                continue
+            finally:
+                beat.cancel()
+                metrics.observe("job", time.monotonic() - started)
+            queue.complete(job["id"], worker, items)
+            metrics.count("jobs_done")
+            done += 1
 
-        await browser.close()
-        return profile_data
+    try:
+        async with async_playwright() as p:
+            browser = await launch_browser(p, cfg)
+            try:
+                await asyncio.gather(*(slot(browser) for _ in range(max(1, cfg.concurrency))))
+            finally:
+                await browser.close()
+    finally:
+        queue.close()
+    log.info(f"[+] Worker {worker} finished: {done} jobs done, {failed} failed")
+    return done, failed
 
-# Scrapes tweets or retweets from a user's timeline
-async def scrape_user_tweets(cfg):
-    tweets, seen_ids, cursor = [], set(), None
-    tco_cache = {}  # Cache for resolved t.co links
+# Sends collected tweets to a `serve` client as NDJSON lines as soon as they arrive
+class SocketSink:
+    def __init__(self, writer):
+        self.writer = writer
+        self.path = None
+        self.count = 0
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=cfg.headless)
-        context = await browser.new_context(
-            user_agent=get_random_user_agent(),
-            locale=get_random_lang(),
-            viewport={"width": 1280, "height": 800}
-        )
+    def write(self, tweet):
+        self.send(tweet.to_dict())
+        self.count += 1
 
-        try:
-            with open(COOKIE_PATH) as fh:
-                cookie_data = json.load(fh)
-            cookies = cookie_data if isinstance(cookie_data, list) else cookie_data.get("cookies", [])
-            await context.add_cookies(cookies)
-        except Exception as e:
-            print(f"[!] Cookie error: {e}. Please update x_cookies.json with valid cookies.")
-            sys.exit(1)
+    def send(self, obj):
+        self.writer.write((json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8"))
 
-        page = await context.new_page()
+    def flush(self):
+        pass
 
-        async def handle_response(response):
-            nonlocal cursor
-            if "UserTweets" in response.url or "SearchTimeline" in response.url:
-                try:
-                    data = await response.json()
-                    instructions = []
-
-                    if "UserTweets" in response.url:
-                        user_result = data.get("data", {}).get("user", {}).get("result", {})
-                        for pth in (
-                            user_result.get("timeline_v2", {}).get("timeline", {}).get("instructions"),
-                            user_result.get("timeline", {}).get("timeline", {}).get("instructions"),
-                            user_result.get("legacy", {}).get("timeline_v2", {}).get("timeline", {}).get("instructions"),
-                        ):
-                            if pth:
-                                instructions = pth
-                                break
-                    else:  # SearchTimeline
-                        instructions = (
-                            data.get("data", {})
-                                .get("search_by_raw_query", {})
-                                .get("search_timeline", {})
-                                .get("timeline", {})
-                                .get("instructions", [])
-                        )
-
-                    for instr in instructions:
-                        for entry in instr.get("entries", []):
-                            eid = entry.get("entryId", "")
-                            if eid.startswith("tweet-"):
-                                t = entry["content"]["itemContent"]["tweet_results"]["result"]
-                                tweet_id = t.get("rest_id")
-                                if not tweet_id or tweet_id in seen_ids:
-                                    print(f"[!] Skipping tweet {tweet_id}: Already processed or invalid ID")
-                                    continue
-                                seen_ids.add(tweet_id)
-
-                                legacy = t.get("legacy", {})
-                                # Hydration for UserTweets only
-                                if "UserTweets" in response.url and (
-                                    legacy.get("favorite_count", 0) == 0 and
-                                    legacy.get("retweet_count", 0) == 0 and
-                                    legacy.get("reply_count", 0) == 0
-                                ):
-                                    hyd = await hydrate_full_tweet(tweet_id, page)
-                                    if hyd:
-                                        legacy.update(hyd)
-                                    else:
-                                        print(f"[!] Skipping tweet {tweet_id}: Hydration failed")
-                                        continue
-
-                                # Handle note_tweet for extended text
-                                note_text = (
-                                    t.get("note_tweet", {})
-                                    .get("note_tweet_results", {})
-                                    .get("result", {})
-                                    .get("text", "")
-                                )
-                                full_text = re.sub(r"\s+", " ", (note_text or legacy.get("full_text", ""))).strip()
-
-                                # Handle retweets
-                                orig_full_text = ""
-                                rt_legacy = None
-                                if full_text.startswith("RT @"):
-                                    rt_status = legacy.get("retweeted_status_result", {}).get("result", {})
-                                    if rt_status:
-                                        rt_legacy = rt_status.get("legacy", {})
-                                        rt_note = (
-                                            rt_status.get("note_tweet", {})
-                                            .get("note_tweet_results", {})
-                                            .get("result", {})
-                                            .get("text", "")
-                                        )
-                                        orig_full_text = re.sub(r"\s+", " ", (rt_note or rt_legacy.get("full_text", ""))).strip()
-                                    if not orig_full_text and "UserTweets" in response.url:
-                                        orig_id = legacy.get("retweeted_status_id_str")
-                                        if orig_id:
-                                            hyd_orig = await hydrate_full_tweet(orig_id, page)
-                                            if hyd_orig:
-                                                note_body = (
-                                                    hyd_orig.get("note_tweet", {})
-                                                        .get("note_tweet_results", {})
-                                                        .get("result", {})
-                                                        .get("text", "")
-                                                )
-                                                orig_full_text = re.sub(r"\s+", " ", (note_body or hyd_orig.get("full_text", ""))).strip()
-                                                rt_legacy = hyd_orig
-
-                                is_rt = full_text.startswith("RT @")
-                                is_rep = full_text.startswith("@")
-
-                                if cfg.type == "tweets" and (is_rt or is_rep):
-                                    continue
-                                if cfg.type == "retweets" and not is_rt:
-                                    continue
-
-                                # Filter retweets: show only text or retweet_full_text
-                                text_value = full_text
-                                retweet_full_text = None
-                                if is_rt and orig_full_text:
-                                    # Strip 'RT @username:' from text
-                                    stripped_text = re.sub(r"^RT @[^:]+:\s*", "", full_text).strip()
-                                    # If orig_full_text provides more data, use it and exclude text
-                                    if orig_full_text != stripped_text and len(orig_full_text) > len(stripped_text):
-                                        text_value = None
-                                        retweet_full_text = orig_full_text
-                                    else:
-                                        text_value = full_text
-                                        retweet_full_text = None
-                                elif not is_rt:
-                                    # Non-retweets: include text, exclude retweet_full_text
-                                    text_value = full_text
-                                    retweet_full_text = None
-
-                                # Determine tweet type for display
-                                tag = "[Original]"
-                                if retweet_full_text is not None:
-                                    tag = "[Retweet]"
-                                elif full_text.startswith("RT @"):
-                                    tag = "[Retweet]"
-                                elif legacy.get("in_reply_to_status_id_str"):
-                                    tag = "[Reply]"
-
-                                # Display progress: Truncate text to 50 characters for readability
-                                display_text = (text_value or retweet_full_text or "No text")
-                                if len(display_text) > 50:
-                                    display_text = display_text[:47] + "..."
-                                print(f"Scraping tweet {tweet_id} {tag}: {display_text}")
-
-                                # Extract media (use retweeted tweet's legacy for retweets)
-                                media = []
-                                seen_urls = set()
-                                media_source = rt_legacy if is_rt and rt_legacy else legacy
-                                for key in ("extended_entities", "entities"):
-                                    for m in media_source.get(key, {}).get("media", []):
-                                        if m["type"] == "photo":
-                                            url = m["media_url_https"]
-                                            if url not in seen_urls:
-                                                media.append({"type": "image", "url": url})
-                                                seen_urls.add(url)
-                                        elif m["type"] in ("video", "animated_gif"):
-                                            best = max(
-                                                m.get("video_info", {}).get("variants", []),
-                                                key=lambda v: v.get("bitrate", 0),
-                                                default={}
-                                            )
-                                            url = best.get("url")
-                                            if url and url not in seen_urls:
-                                                media.append({"type": "video", "url": url})
-                                                seen_urls.add(url)
-
-                                # Extract expanded URLs from both legacy and rt_legacy (if retweet)
-                                expanded_urls = []
-                                seen_expanded_urls = set()
-                                # First, check the retweeting tweet's legacy (where full_text comes from)
-                                for key in ("extended_entities", "entities"):
-                                    urls = legacy.get(key, {}).get("urls", [])
-                                    for u in urls:
-                                        expanded_url = u.get("expanded_url")
-                                        if expanded_url and expanded_url not in seen_expanded_urls:
-                                            expanded_urls.append(expanded_url)
-                                            seen_expanded_urls.add(expanded_url)
-                                # Then, check the retweeted tweet's rt_legacy (if applicable)
-                                if is_rt and rt_legacy:
-                                    for key in ("extended_entities", "entities"):
-                                        urls = rt_legacy.get(key, {}).get("urls", [])
-                                        for u in urls:
-                                            expanded_url = u.get("expanded_url")
-                                            if expanded_url and expanded_url not in seen_expanded_urls:
-                                                expanded_urls.append(expanded_url)
-                                                seen_expanded_urls.add(expanded_url)
-
-                                # Fallback: If no expanded URLs found, resolve t.co links
-                                if not expanded_urls:
-                                    text_to_check = (text_value or "") + (" " + retweet_full_text if retweet_full_text else "")
-                                    tco_links = re.findall(r"https://t\.co/[a-zA-Z0-9]+", text_to_check)
-                                    for tco_url in tco_links:
-                                        if tco_url not in seen_expanded_urls:
-                                            if tco_url in tco_cache:
-                                                expanded_url = tco_cache[tco_url]
-                                            else:
-                                                try:
-                                                    response = await page.request.get(tco_url, max_redirects=10)
-                                                    expanded_url = response.url
-                                                    tco_cache[tco_url] = expanded_url
-                                                    await asyncio.sleep(0.1)  # Reduced delay
-                                                except Exception as e:
-                                                    print(f"[!] Failed to resolve t.co URL {tco_url} for tweet {tweet_id}: {str(e)}")
-                                                    continue
-                                            if expanded_url and expanded_url not in seen_expanded_urls:
-                                                expanded_urls.append(expanded_url)
-                                                seen_expanded_urls.add(expanded_url)
-
-                                # Construct URLs
-                                tweet_url = f"https://x.com/{cfg.username}/status/{tweet_id}"
-                                parent_id = legacy.get("in_reply_to_status_id_str", None)
-                                parent_url = f"https://x.com/{cfg.username}/status/{parent_id}" if parent_id else None
-
-                                # Normalize tweet data
-                                tweet_data = {
-                                    "id": tweet_id,
-                                    "text": text_value,
-                                    "retweet_full_text": retweet_full_text,
-                                    "created_at": legacy.get("created_at", "unknown"),
-                                    "likes": legacy.get("favorite_count", 0),
-                                    "retweets": legacy.get("retweet_count", 0),
-                                    "replies": legacy.get("reply_count", 0),
-                                    "bookmarks": legacy.get("bookmark_count", 0),
-                                    "media": media,
-                                    "expanded_urls": expanded_urls,
-                                    "parent": parent_id,
-                                    "url": tweet_url,
-                                    "parent_url": parent_url
-                                }
-                                tweets.append(tweet_data)
-                                if len(tweets) >= cfg.max:
-                                    return
-
-                            elif eid.startswith("cursor-bottom"):
-                                cursor = entry["content"]["value"]
-                except Exception as e:
-                    print(f"[!] Error processing response: {str(e)}")
+    def close(self):
+        pass
 
-        page.on("response", handle_response)
+# Job fields `serve` accepts. Anything writing files or sizing pools (download_media,
+# record, state, caches, workers) stays a server-side option, since any local client,
+# including a web page, can post jobs.
+JOB_FIELDS = ("username", "type", "max", "since_after", "before", "date_mode", "scrolls",
+              "pagination", "threads")
 
-        if cfg.since_after or cfg.before:
-            q_parts = [f"from:{cfg.username}"]
-            if cfg.since_after:
-                q_parts.append(f"since:{cfg.since_after.strftime('%Y-%m-%d')}")
-            if cfg.before:
-                q_parts.append(f"until:{cfg.before.strftime('%Y-%m-%d')}")
-            q = urllib.parse.quote(" ".join(q_parts))
-            url = f"https://x.com/search?q={q}&src=typed_query"
-            await page.goto(url, timeout=60000)
-            await page.click("text=Latest")
-        else:
-            await page.goto(f"https://x.com/{cfg.username}", timeout=60000)
+# Builds a job's config from its JSON fields through the normal CLI parser, so jobs get
+# the same defaults and validation: {"max": 50, "since_after": "2025-01-01"} becomes
+# --max 50 --since-after 2025-01-01
+def job_cfg(job):
+    if not isinstance(job, dict):
+        raise ValueError("a job must be a JSON object")
+    unknown = sorted(set(job) - set(JOB_FIELDS))
+    if unknown:
+        raise ValueError(f"unsupported field(s): {', '.join(unknown)}")
+    argv = ["--username", str(job["username"])]
+    for key, value in job.items():
+        if key == "username" or value is None or value is False:
+            continue
+        argv.append("--" + key.replace("_", "-"))
+        if value is not True:
+            argv.append(str(value))
+    errors = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(errors):
+            return cfg_from_args(build_arg_parser().parse_args(argv))
+    except SystemExit:
+        raise ValueError(errors.getvalue().strip().splitlines()[-1]) from None
 
-        no_new = 0
-        for _ in range(cfg.scrolls):
-            if len(tweets) >= cfg.max:
-                break
-            prev_count = len(tweets)
-            await page.evaluate("() => window.scrollTo(0, document.body.scrollHeight)")
-            await asyncio.sleep(max(2, cfg.delay))
-            if len(tweets) == prev_count:
-                no_new += 1
-            else:
-                no_new = 0
-            if no_new >= 3:
-                break
+# Reads one HTTP/1.1 request; returns (method, path, body)
+async def read_http_request(reader):
+    method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1")
+        if line in ("\r\n", "\n", ""):
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+    return method, path, body
+
+# Keeps a browser and authenticated contexts warm and runs jobs posted over local HTTP.
+# POST /jobs {"username": ..., "type": ..., "max": ..., "since_after": ..., "before": ...}
+# streams tweets back as NDJSON, then a {"done": ...} line; GET /health reports idle contexts.
+async def serve(args):
+    load_cookies()  # Fail fast on bad cookies before launching anything
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=args.headless)
+        contexts = asyncio.Queue()  # (context, ProfileFetcher) pairs not running a job
+        warm = []
+        for _ in range(max(1, args.contexts)):
+            context = await new_scrape_context(browser, args.block, storage_state=args.storage_state)
+            page = await context.new_page()
+            try:
+                # One page load fills the HTTP cache and session before the first job
+                await page.goto("https://x.com/home", wait_until="domcontentloaded", timeout=60000)
+            except Exception as e:
+                log.warning(f"[!] Warm-up page load failed: {str(e)}")
+            finally:
+                await page.close()
+            warm.append(context)
+            contexts.put_nowait((context, ProfileFetcher(context, args.page_timeout)))
+        await warm[0].storage_state(path=args.storage_state)
+
+        async def run_job(writer, job):
+            sink = SocketSink(writer)
+            context, fetcher = await contexts.get()
+            started = time.monotonic()
+            try:
+                cfg = job_cfg(job)
+                if cfg.type == "bio":
+                    profile = await fetcher.lookup(cfg.username)
+                    if profile:
+                        sink.send(profile)
+                        sink.count += 1
+                else:
+                    await scrape_user_tweets(cfg, sink=sink, context=context)
+                sink.send({"done": True, "username": cfg.username, "count": sink.count,
+                           "seconds": round(time.monotonic() - started, 3)})
+            finally:
+                metrics.observe("job", time.monotonic() - started)
+                contexts.put_nowait((context, fetcher))
+
+        async def handle_client(reader, writer):
+            try:
+                method, path, body = await read_http_request(reader)
+                if method == "GET" and path == "/health":
+                    status, payload = "200 OK", {"ok": True, "idle_contexts": contexts.qsize()}
+                elif method == "POST" and path == "/jobs":
+                    try:
+                        job = json.loads(body or b"{}")
+                        job_cfg(job)  # Reject bad jobs before streaming starts
+                    except (ValueError, KeyError, TypeError) as e:
+                        status, payload = "400 Bad Request", {"error": f"invalid job: {e}"}
+                    else:
+                        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                                     b"Connection: close\r\n\r\n")
+                        try:
+                            await run_job(writer, job)
+                        except Exception as e:
+                            SocketSink(writer).send({"error": str(e)})
+                        return
+                else:
+                    status, payload = "404 Not Found", {"error": "use POST /jobs or GET /health"}
+                body = (json.dumps(payload) + "\n").encode("utf-8")
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            except Exception as e:
+                log.warning(f"[!] Bad request: {str(e)}")
+            finally:
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+                writer.close()
 
-        # Sort tweets by created_at (newest to oldest)
+        if args.socket:
+            Path(args.socket).unlink(missing_ok=True)
+            server = await asyncio.start_unix_server(handle_client, path=args.socket)
+            log.info(f"[+] Serving on unix:{args.socket}")
+        else:
+            server = await asyncio.start_server(handle_client, args.host, args.port)
+            log.info(f"[+] Serving on http://{args.host}:{args.port}")
         try:
-            tweets.sort(
-                key=lambda t: datetime.strptime(t["created_at"], "%a %b %d %H:%M:%S %z %Y"),
-                reverse=True
-            )
-        except ValueError as e:
-            print(f"[!] Error sorting tweets by date: {e}")
+            async with server:
+                await server.serve_forever()
+        finally:
+            await warm[0].storage_state(path=args.storage_state)
+            await browser.close()
 
-        await browser.close()
-        return tweets[:cfg.max]
+# Adds the metrics and log format options shared by the scraper and `serve`
+def add_metrics_arguments(ap):
+    ap.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Write a JSON report of phase timings, request counts, bytes, cache\n"
+             "hit rates, tweets/sec and peak RSS to PATH at exit"
+    )
+    ap.add_argument(
+        "--metrics-prom",
+        metavar="PATH",
+        help="Keep a Prometheus textfile of the same metrics up to date at PATH"
+    )
+    ap.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=15,
+        help="Seconds between --metrics-prom rewrites (default: 15)"
+    )
+    ap.add_argument(
+        "--log-format",
+        choices=["text", "json"],
+        default="text",
+        help="Log lines as plain text or one JSON object per line (default: text)"
+    )
 
-# Parses arguments and runs the scraper
-if __name__ == "__main__":
+# Builds the parser for `zenscraper.py serve`
+def build_serve_parser():
     ap = argparse.ArgumentParser(
-        description="Scrape tweets, retweets, or profile bio from X.com",
+        prog="zenscraper.py serve",
+        description="Keep a warm, logged-in browser and run scrape jobs posted over local HTTP",
         formatter_class=argparse.RawTextHelpFormatter
     )
     ap.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on (default: 127.0.0.1)"
+    )
+    ap.add_argument(
+        "--port",
+        type=int,
+        default=8642,
+        help="Port to listen on (default: 8642)"
+    )
+    ap.add_argument(
+        "--socket",
+        help="Listen on this Unix socket instead of TCP"
+    )
+    ap.add_argument(
+        "--contexts",
+        type=int,
+        default=3,
+        help="Warm browser contexts, i.e. jobs run at once (default: 3)"
+    )
+    ap.add_argument(
+        "--storage-state",
+        default="zenscraper_storage.json",
+        help="Session file reused across restarts instead of re-injecting\n"
+             "x_cookies.json (default: zenscraper_storage.json)"
+    )
+    ap.add_argument(
+        "--block",
+        choices=list(BLOCK_PROFILES),
+        default="media",
+        help="Request blocking profile for the warm contexts (default: media)"
+    )
+    ap.add_argument(
+        "--page-timeout",
+        type=float,
+        default=15,
+        help="Seconds to wait for a profile response (default: 15)"
+    )
+    ap.add_argument(
+        "--no-headless",
+        dest="headless",
+        action="store_false",
+        help="Display browser while serving (default: headless)"
+    )
+    add_metrics_arguments(ap)
+    return ap
+
+# Builds the command-line parser; programmatic callers reuse it for defaults
+def build_arg_parser():
+    ap = argparse.ArgumentParser(
+        description="Scrape tweets, retweets, or profile bio from X.com",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    target = ap.add_mutually_exclusive_group(required=True)
+    target.add_argument(
         "--username",
-        required=True,
-        help="(Required) X.com username to scrape"
+        help="X.com username to scrape"
+    )
+    target.add_argument(
+        "--usernames-file",
+        help="File with one username per line to scrape in a single batch"
+    )
+    target.add_argument(
+        "--worker",
+        metavar="QUEUE",
+        help="Run as a worker: claim username jobs from the SQLite queue file\n"
+             "QUEUE (shared by workers on any number of machines) until it is empty"
+    )
+    target.add_argument(
+        "--queue-stats",
+        metavar="QUEUE",
+        help="Print job counts, job durations and dead jobs of QUEUE as JSON"
     )
     ap.add_argument(
         "--type",
@@ -500,7 +3162,9 @@ if __name__ == "__main__":
     )
     ap.add_argument(
         "--output",
-        help="Output file (.json or .txt) (default: <username>.json)"
+        help="Output file (.json, .ndjson/.jsonl, .txt, .parquet or .csv), or\n"
+             "sqlite:///PATH.db to upsert into an indexed database (default: <username>.json)\n"
+             "In batch mode this is a template containing {username}, or one database"
     )
     ap.add_argument(
         "--since-after",
@@ -510,6 +3174,35 @@ if __name__ == "__main__":
         "--before",
         help="Include tweets before this date (ISO 8601)"
     )
+    ap.add_argument(
+        "--date-mode",
+        choices=["auto", "search", "timeline"],
+        default="auto",
+        help="How --since-after/--before are applied: search the date range, or walk the\n"
+             "profile timeline and stop once it is older than --since-after\n"
+             "(default: auto, timeline for --type retweets, search otherwise)"
+    )
+    ap.add_argument(
+        "--shard-days",
+        type=int,
+        default=30,
+        help="With --since-after, split the date range into search windows of\n"
+             "this many days; dense windows are split further (default: 30)"
+    )
+    ap.add_argument(
+        "--shard-workers",
+        type=int,
+        default=3,
+        help="Search windows walked at once, each on its own page (default: 3)"
+    )
+    ap.add_argument(
+        "--cookies",
+        action="append",
+        metavar="PATH",
+        help="Cookie file of an account to scrape with; repeat it or pass a directory\n"
+             "of cookie files to spread requests over several accounts\n"
+             "(default: x_cookies.json)"
+    )
     ap.add_argument(
         "--no-headless",
         dest="headless",
@@ -520,7 +3213,28 @@ if __name__ == "__main__":
         "--scrolls",
         type=int,
         default=30,
-        help="Number of scroll actions (default: 30)"
+        help="Number of scroll actions or cursor pages (default: 30)"
+    )
+    ap.add_argument(
+        "--page-timeout",
+        type=float,
+        default=15,
+        help="Seconds to wait for a timeline or profile response before\n"
+             "treating the page as exhausted (default: 15)"
+    )
+    ap.add_argument(
+        "--api",
+        action="store_true",
+        help="Skip the browser: call the GraphQL endpoints directly with the account\n"
+             "cookies, paging by cursor (query IDs come from graphql_templates.json,\n"
+             "saved by browser runs, or built-in defaults)"
+    )
+    ap.add_argument(
+        "--pagination",
+        choices=["scroll", "cursor"],
+        default="scroll",
+        help="Page by scrolling the web app, or by requesting GraphQL pages\n"
+             "directly with the timeline cursor (default: scroll)"
     )
     ap.add_argument(
         "--max",
@@ -532,49 +3246,296 @@ if __name__ == "__main__":
         "--delay",
         type=float,
         default=2.0,
-        help="Add delay for throttling (default: 2)"
+        help="Minimum seconds between page requests for throttling (default: 2)"
     )
-    args = ap.parse_args()
+    ap.add_argument(
+        "--block",
+        choices=list(BLOCK_PROFILES),
+        default="media",
+        help="Requests aborted in the browser: none; media (images, video,\n"
+             "fonts and telemetry hosts); strict (media plus stylesheets,\n"
+             "beacons and manifests) (default: media)"
+    )
+    ap.add_argument(
+        "--hydrate-workers",
+        type=int,
+        default=4,
+        help="TweetDetail hydration requests in flight at once, per account (default: 4)"
+    )
+    ap.add_argument(
+        "--hydrate-rate",
+        type=float,
+        default=2.0,
+        help="Maximum TweetDetail hydration requests per second, per account,\n"
+             "0 for unlimited (default: 2)"
+    )
+    ap.add_argument(
+        "--threads",
+        action="store_true",
+        help="Add each reply's ancestor tweets, root first, as a \"thread\" list"
+    )
+    ap.add_argument(
+        "--detail-cache",
+        default=str(DETAIL_CACHE_PATH),
+        help="SQLite file caching every tweet of each fetched TweetDetail conversation\n"
+             "across runs; pass an empty string to disable (default: tweet_detail_cache.db)"
+    )
+    ap.add_argument(
+        "--detail-cache-ttl",
+        type=float,
+        default=7,
+        help="Days a cached conversation tweet stays valid (default: 7)"
+    )
+    ap.add_argument(
+        "--detail-cache-size",
+        type=int,
+        default=200000,
+        help="Maximum cached tweets before LRU eviction (default: 200000)"
+    )
+    ap.add_argument(
+        "--tco-cache",
+        default=str(TCO_CACHE_PATH),
+        help="SQLite file caching resolved t.co links across runs;\n"
+             "pass an empty string to disable (default: tco_cache.db)"
+    )
+    ap.add_argument(
+        "--tco-cache-ttl",
+        type=float,
+        default=30,
+        help="Days a resolved t.co link stays cached (default: 30)"
+    )
+    ap.add_argument(
+        "--tco-cache-size",
+        type=int,
+        default=200000,
+        help="Maximum cached t.co links before LRU eviction (default: 200000)"
+    )
+    ap.add_argument(
+        "--download-media",
+        metavar="DIR",
+        help="Download photos and videos into DIR, stored by content hash, and add\n"
+             "each file's local path to its media entry"
+    )
+    ap.add_argument(
+        "--download-workers",
+        type=int,
+        default=4,
+        help="Concurrent media downloads (default: 4)"
+    )
+    ap.add_argument(
+        "--download-rate",
+        type=float,
+        default=0,
+        help="Media download bandwidth budget in MB/s, 0 for unlimited (default: 0)"
+    )
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only collect tweets newer than the previous run and merge them\n"
+             "into the existing output file"
+    )
+    ap.add_argument(
+        "--state",
+        default=str(STATE_PATH),
+        help="SQLite file holding per-user incremental state (default: zenscraper_state.db)"
+    )
+    ap.add_argument(
+        "--stream",
+        action="store_true",
+        help="Write each tweet as soon as it is scraped; .json output is spooled\n"
+             "to <output>.ndjson and sorted into place at the end\n"
+             "(.ndjson/.jsonl output always streams)"
+    )
+    ap.add_argument(
+        "--row-group-size",
+        type=int,
+        default=10000,
+        help="Tweets per Parquet row group, or between CSV flushes, for .parquet\n"
+             "and .csv output (default: 10000)"
+    )
+    ap.add_argument(
+        "--parse-workers",
+        type=int,
+        default=0,
+        help="Normalize timeline payloads in this many worker processes instead\n"
+             "of on the browser event loop (default: 0, in-process)"
+    )
+    ap.add_argument(
+        "--record",
+        help="Save every captured GraphQL payload under DIR/<username>/ for replay"
+    )
+    ap.add_argument(
+        "--replay",
+        help="Build the output from a recorded payload directory instead of\n"
+             "scraping (no browser is started)"
+    )
+    add_metrics_arguments(ap)
+    ap.add_argument(
+        "--concurrency",
+        type=int,
+        default=3,
+        help="Browser contexts run at once in batch and worker mode (default: 3)"
+    )
+    ap.add_argument(
+        "--enqueue",
+        metavar="QUEUE",
+        help="With --usernames-file, add a job of --type per username to the\n"
+             "queue file QUEUE instead of scraping them"
+    )
+    ap.add_argument(
+        "--lease",
+        type=float,
+        default=600,
+        help="Seconds a worker holds a job without renewing it before the job\n"
+             "is handed to another worker (default: 600)"
+    )
+    ap.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="Attempts per queued job before it is dead-lettered (default: 3)"
+    )
+    ap.add_argument(
+        "--queue-wait",
+        action="store_true",
+        help="Keep a worker polling for new jobs once the queue is empty"
+    )
+    return ap
 
-    class Cfg: pass
+class Cfg: pass
+
+# Copies parsed arguments onto a Cfg object used by the scrapers
+def cfg_from_args(args):
     cfg = Cfg()
     cfg.username = args.username
     cfg.type     = args.type
     cfg.output   = args.output
     cfg.headless = args.headless
+    cfg.cookies = cookie_files(args.cookies or [COOKIE_PATH])
     cfg.scrolls  = args.scrolls
+    cfg.pagination = args.pagination
+    cfg.api      = args.api
+    cfg.page_timeout = args.page_timeout
     cfg.max      = args.max
     cfg.delay    = args.delay
+    cfg.block    = args.block
+    cfg.concurrency = args.concurrency
+    cfg.hydrate_workers = args.hydrate_workers
+    cfg.hydrate_rate = args.hydrate_rate
+    cfg.threads  = args.threads
+    cfg.detail_cache = args.detail_cache
+    cfg.detail_cache_ttl = args.detail_cache_ttl
+    cfg.detail_cache_size = args.detail_cache_size
+    cfg.tco_cache = args.tco_cache
+    cfg.tco_cache_ttl = args.tco_cache_ttl
+    cfg.tco_cache_size = args.tco_cache_size
+    cfg.download_media = args.download_media
+    cfg.download_workers = args.download_workers
+    cfg.download_rate = args.download_rate
+    cfg.incremental = args.incremental
+    cfg.state    = args.state
+    cfg.stream   = args.stream
+    cfg.row_group_size = args.row_group_size
+    cfg.record   = args.record
+    cfg.parse_workers = args.parse_workers
+    cfg.date_mode = args.date_mode
+    cfg.shard_days = args.shard_days
+    cfg.shard_workers = args.shard_workers
     cfg.since_after = None
     cfg.before   = None
     if args.since_after:
         cfg.since_after = datetime.fromisoformat(args.since_after).replace(tzinfo=timezone.utc)
     if args.before:
         cfg.before = datetime.fromisoformat(args.before).replace(tzinfo=timezone.utc)
+    return cfg
 
-    # Decide whether to scrape tweets or profile based on --type
-    if cfg.type == "bio":
-        result = asyncio.run(scrape_user_profile(cfg))
-        # For bio, result is a single dict, but we wrap it in a list for consistency
-        result_list = [result] if result else []
-        print(f"[+] Collected profile for {cfg.username}")
-    else:
-        result_list = asyncio.run(scrape_user_tweets(cfg))
-        print(f"[+] Collected {len(result_list)} items")
+# Parses arguments and runs the scraper
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["serve"]:
+        serve_args = build_serve_parser().parse_args(sys.argv[2:])
+        setup_logging(serve_args.log_format)
+        enable_metrics(serve_args.metrics, serve_args.metrics_prom, serve_args.metrics_interval)
+        try:
+            asyncio.run(serve(serve_args))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    ap = build_arg_parser()
+    args = ap.parse_args()
+    cfg = cfg_from_args(args)
+    setup_logging(args.log_format)
+    enable_metrics(args.metrics, args.metrics_prom, args.metrics_interval)
+
+    if args.queue_stats:
+        queue = JobQueue(args.queue_stats)
+        print(json.dumps(queue.stats(), indent=2, ensure_ascii=False))
+        queue.close()
+        sys.exit(0)
+
+    if args.enqueue:
+        if not args.usernames_file:
+            ap.error("--enqueue requires --usernames-file")
+        queue = JobQueue(args.enqueue)
+        usernames = read_usernames(args.usernames_file)
+        added = queue.enqueue(usernames, cfg.type, args.max_attempts)
+        queue.close()
+        log.info(f"[+] Queued {added} of {len(usernames)} {cfg.type} jobs in {args.enqueue}")
+        sys.exit(0)
+
+    if (args.usernames_file or args.worker) and cfg.output and "{username}" not in cfg.output \
+            and not sqlite_output_path(cfg.output):
+        ap.error("--output must contain {username} (or be a sqlite:/// database) in batch and worker mode")
+
+    if args.hydrate_rate < 0:
+        ap.error("--hydrate-rate must be 0 (unlimited) or more")
+
+    if args.row_group_size < 1:
+        ap.error("--row-group-size must be at least 1")
+
+    if args.download_workers < 1:
+        ap.error("--download-workers must be at least 1")
+
+    if args.hydrate_workers < 1:
+        ap.error("--hydrate-workers must be at least 1")
+
+    if args.shard_days < 1:
+        ap.error("--shard-days must be at least 1")
+
+    if cfg.incremental and (cfg.output or "").lower().endswith(".parquet"):
+        ap.error("--incremental cannot append to Parquet files; use .csv or sqlite:/// output")
+
+    if args.worker:
+        cfg.output = cfg.output or "{username}.json"
+        done, failed = asyncio.run(run_worker(cfg, args.worker, args.lease, args.queue_wait))
+        sys.exit(1 if failed and not done else 0)
+
+    if args.usernames_file:
+        cfg.output = cfg.output or "{username}.json"
+        usernames = read_usernames(args.usernames_file)
+        failed = asyncio.run(scrape_batch(cfg, usernames))
+        sys.exit(1 if failed and len(failed) == len(usernames) else 0)
 
     default_name = f"{cfg.username}.json"
 
     out_file = cfg.output or default_name
 
-    try:
-        with open(out_file, "w", encoding="utf-8") as fh:
-            if out_file.lower().endswith(".txt"):
-                if cfg.type == "bio":
-                    fh.write(format_profile_as_text(result))
-                else:
-                    fh.write(format_tweets_as_text(result_list))
+    # Decide whether to scrape tweets or profile based on --type
+    sink = None
+    if cfg.type == "bio":
+        result = asyncio.run(scrape_user_profile(cfg))
+        log.info(f"[+] Collected profile for {cfg.username}")
+    else:
+        sink = open_sink(cfg, out_file)
+        try:
+            if args.replay:
+                result = asyncio.run(replay_recording(cfg, args.replay, sink))
             else:
-                json.dump(result_list, fh, indent=2, ensure_ascii=False)
-        print(f"[+] Saved → {out_file}")
-    except Exception as e:
-        print(f"[!] Write failed: {e}")
\ No newline at end of file
+                result = asyncio.run(scrape_user_tweets(cfg, sink=sink,
+                                                        on_profile=profile_saver(cfg, out_file)))
+        finally:
+            if sink:
+                sink.close()  # Keep everything written so far, even on a crash
+        log.info(f"[+] Collected {sink.count if sink else len(result)} items")
+
+    save_results(cfg, result, out_file, sink)